@@ -2,79 +2,1890 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime, date
 import hashlib
+import hmac
 from fpdf import FPDF
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
 import uuid
 import random
 import io
+import os
+import threading
+import time
+import bisect
+import re
+import sqlite3
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ThreadPoolExecutor, Future
+from functools import lru_cache, wraps
+from collections import deque
+import json
 
 # --- KONFIGURASI ---
 SCOPE = ['https://spreadsheets.google.com/feeds', 'https://www.googleapis.com/auth/drive']
 SHEET_NAME = "DB_KeuanganRT" 
+TOKEN_REFRESH_DETIK = 45 * 60 # Token OAuth berlaku 60 menit, diperbarui sebelum kedaluwarsa
+SYNC_DEBOUNCE_DETIK = 2
+SHEETS_KODE_ULANG = {429, 500, 502, 503} # kuota habis / gangguan sementara di sisi Google
+SHEETS_KODE_ULANG_TULIS = {429} # 5xx pada tulisan bisa saja sudah diterapkan: append/hapus per posisi tidak boleh diulang buta
+
+WORKSHEET_HEADERS = {
+    "users": ['username','password','role','nama_lengkap'],
+    "transaksi": ['id','tanggal','tipe','kategori','nominal','keterangan','user_input','file_bukti'],
+    "kategori": ['id','nama','jenis'],
+    "tunggakan": ['id','nama_warga','periode','nominal','status','periode_key'],
+    "arisan_peserta": ['id','nama_warga','status_menang'],
+    "arisan_bayar": ['id','nama_warga','periode','nominal','status_bayar','tanggal_bayar'],
+    "arisan_log": ['id','waktu','putaran','seed','peserta_id','nama_warga','kandidat','admin'],
+    "warga": ['id','no','nama','nominal'],
+    "arsip_transaksi": ['id','tanggal','tipe','kategori','nominal','keterangan','user_input','file_bukti','periode_arsip'],
+    "arsip_manifest": ['periode','baris','checksum','ditutup_oleh','waktu'],
+}
+
+KEY_COLUMNS = {"users": "username", "arsip_manifest": "periode"} # Worksheet lain memakai kolom 'id'
+DERIVED_COLUMNS = {"tunggakan": ['periode_key']} # dihitung ulang dari kolom lain saat simpan; bukan perubahan data
+
+def key_column(worksheet_name): return KEY_COLUMNS.get(worksheet_name, 'id')
+
+DERIVED_WORKSHEETS = {"transaksi", "tunggakan"} # Worksheet yang punya ringkasan/indeks turunan
+
+SQLITE_SCHEMA = {
+    "users": "username TEXT PRIMARY KEY, password TEXT, role TEXT, nama_lengkap TEXT",
+    "transaksi": "id TEXT PRIMARY KEY, tanggal DATE, tipe TEXT, kategori TEXT, nominal REAL, keterangan TEXT, user_input TEXT, file_bukti TEXT",
+    "kategori": "id INTEGER PRIMARY KEY AUTOINCREMENT, nama TEXT, jenis TEXT",
+    "tunggakan": "id TEXT PRIMARY KEY, nama_warga TEXT, periode TEXT, nominal REAL, status TEXT, periode_key TEXT",
+    "arisan_peserta": "id TEXT PRIMARY KEY, nama_warga TEXT, status_menang TEXT",
+    "arisan_bayar": "id TEXT PRIMARY KEY, nama_warga TEXT, periode TEXT, nominal REAL, status_bayar TEXT, tanggal_bayar DATE",
+    "arisan_log": "id TEXT PRIMARY KEY, waktu TEXT, putaran INTEGER, seed TEXT, peserta_id TEXT, nama_warga TEXT, kandidat TEXT, admin TEXT",
+    "warga": "id TEXT PRIMARY KEY, no INTEGER, nama TEXT, nominal REAL",
+    "arsip_transaksi": "id TEXT PRIMARY KEY, tanggal DATE, tipe TEXT, kategori TEXT, nominal REAL, keterangan TEXT, user_input TEXT, file_bukti TEXT, periode_arsip TEXT",
+    "arsip_manifest": "periode TEXT PRIMARY KEY, baris INTEGER, checksum TEXT, ditutup_oleh TEXT, waktu TEXT",
+}
+SQLITE_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS idx_transaksi_tanggal ON transaksi(tanggal)",
+    "CREATE INDEX IF NOT EXISTS idx_transaksi_tipe ON transaksi(tipe)",
+    "CREATE INDEX IF NOT EXISTS idx_tunggakan_status ON tunggakan(status)",
+    "CREATE INDEX IF NOT EXISTS idx_tunggakan_periode ON tunggakan(periode_key)",
+    "CREATE INDEX IF NOT EXISTS idx_arisan_bayar_tanggal ON arisan_bayar(tanggal_bayar)",
+]
+
+def get_config(key, default):
+    # Urutan prioritas: environment variable, lalu st.secrets, lalu default
+    if key in os.environ: return type(default)(os.environ[key])
+    try: return type(default)(st.secrets.get(key, default))
+    except Exception: return default
+
+# --- INSTRUMENTASI ---
+PROFILING_AKTIF = bool(get_config("PROFILING_AKTIF", 0))
+PROFILING_SAMPEL = get_config("PROFILING_SAMPEL", 2000) # sampel terakhir per timer untuk p50/p95/p99
+
+class _Timer:
+    __slots__ = ("profiler", "name", "t0")
+    def __init__(self, profiler, name):
+        self.profiler, self.name = profiler, name
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, time.perf_counter() - self.t0)
+
+class Profiler:
+    # Timer & counter bergulir untuk jalur panas; saat nonaktif timer() hanya mengembalikan nullcontext bersama
+    _NOOP = nullcontext()
+
+    def __init__(self, enabled, max_samples):
+        self.enabled = enabled
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.samples = {} # nama -> deque durasi (detik)
+            self.totals = {} # nama -> [jumlah, total detik]
+            self.counters = {}
+
+    def timer(self, name):
+        return _Timer(self, name) if self.enabled else self._NOOP
+
+    def count(self, name, n=1):
+        if not self.enabled: return
+        with self._lock: self.counters[name] = self.counters.get(name, 0) + n
+
+    def record(self, name, elapsed):
+        with self._lock:
+            q = self.samples.get(name)
+            if q is None: q = self.samples[name] = deque(maxlen=self.max_samples)
+            q.append(elapsed)
+            t = self.totals.setdefault(name, [0, 0.0])
+            t[0] += 1; t[1] += elapsed
+        ctx = current_rerun()
+        if ctx:
+            t = ctx.timings.setdefault(name, [0, 0.0])
+            t[0] += 1; t[1] += elapsed
+
+    def report(self):
+        # Satu baris per timer, dalam milidetik; persentil dari sampel bergulir, jumlah & total sejak reset
+        with self._lock: items = [(k, list(q), *self.totals[k]) for k, q in self.samples.items()]
+        rows = []
+        for name, sampel, n, total in items:
+            p50, p95, p99 = pd.Series(sampel).quantile([0.5, 0.95, 0.99]) * 1000
+            rows.append({"timer": name, "jumlah": n, "total_ms": total * 1000, "p50_ms": p50, "p95_ms": p95, "p99_ms": p99, "maks_ms": max(sampel) * 1000})
+        cols = ["timer", "jumlah", "total_ms", "p50_ms", "p95_ms", "p99_ms", "maks_ms"]
+        return pd.DataFrame(rows, columns=cols).sort_values("total_ms", ascending=False, ignore_index=True)
+
+    def export_json(self):
+        with self._lock: counters = dict(self.counters)
+        return json.dumps({"waktu": datetime.now().isoformat(timespec='seconds'), "timer": self.report().round(3).to_dict('records'), "counter": counters}, indent=2)
+
+    def export_csv(self):
+        return self.report().round(3).assign(waktu=datetime.now().isoformat(timespec='seconds')).to_csv(index=False)
+
+@st.cache_resource
+def get_profiler():
+    return Profiler(PROFILING_AKTIF, PROFILING_SAMPEL)
+
+PROFILER = get_profiler()
+
+def timed(name):
+    def deco(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled: return fn(*args, **kwargs)
+            with _Timer(PROFILER, name): return fn(*args, **kwargs)
+        return wrapper
+    return deco
+
+# --- POOL KONEKSI GOOGLE SHEETS ---
+class SheetsUnavailable(Exception):
+    # Sheets tidak bisa dibaca/ditulis (koneksi, kuota); berbeda dengan worksheet yang memang kosong
+    pass
+
+class QuotaExceeded(SheetsUnavailable):
+    pass
+
+class TokenBucket:
+    # Kuota per menit Sheets API: terisi rate/60 token per detik, maksimal `capacity`; acquire() menunggu bila habis
+    def __init__(self, per_menit, capacity=None):
+        self.rate = per_menit / 60.0
+        self.capacity = capacity or per_menit
+        self.tokens = float(self.capacity)
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+class SheetsPool:
+    # Satu client gspread per proses: token dipakai ulang, handle Spreadsheet/Worksheet di-cache per nama.
+    # Semua panggilan lewat run()/read(): dibatasi token bucket, diulang dengan backoff, baca identik digabung.
+    def __init__(self, authorize=None):
+        self._lock = threading.RLock()
+        self._authorize = authorize or _authorize
+        self._sheet = None
+        self._worksheets = {}
+        self._authorized_at = 0.0
+        self._inflight = {} # (worksheet, jenis baca) -> Future yang sedang berjalan
+        self._inflight_lock = threading.Lock()
+        self.buckets = {"baca": TokenBucket(get_config("SHEETS_KUOTA_BACA_PER_MENIT", 60)), "tulis": TokenBucket(get_config("SHEETS_KUOTA_TULIS_PER_MENIT", 60))}
+        self.max_retries = get_config("SHEETS_MAKS_ULANG", 5)
+        self.backoff = get_config("SHEETS_BACKOFF_DETIK", 1.0)
+        self.stats = {"reconnect": 0, "panggilan": 0, "gagal": 0, "latensi_total": 0.0, "latensi_terakhir": 0.0, "latensi_maks": 0.0,
+                      "kuota_429": 0, "diulang": 0, "digabung": 0, "antre_detik": 0.0}
+
+    @timed("sheets.authorize")
+    def _connect(self):
+        client = self._authorize()
+        self._sheet = client.open(SHEET_NAME)
+        self._worksheets = {}
+        self._authorized_at = time.monotonic()
+        self.stats["reconnect"] += 1
+
+    def reset(self):
+        with self._lock:
+            self._sheet = None
+            self._worksheets = {}
+
+    def set_authorizer(self, authorize):
+        # Ganti sumber client gspread (mis. fake_sheets.FakeClient untuk benchmark offline)
+        with self._lock:
+            self._authorize = authorize
+            self.reset()
+
+    def spreadsheet(self):
+        with self._lock:
+            if self._sheet is None or time.monotonic() - self._authorized_at > TOKEN_REFRESH_DETIK:
+                self._connect()
+            return self._sheet
+
+    def worksheet(self, worksheet_name):
+        with self._lock:
+            sheet = self.spreadsheet()
+            if worksheet_name not in self._worksheets:
+                self._worksheets[worksheet_name] = sheet.worksheet(worksheet_name)
+            return self._worksheets[worksheet_name]
+
+    def run(self, worksheet_name, op, write=True):
+        # Jalankan op(ws) (atau op(spreadsheet) bila worksheet_name None).
+        # 401 -> sambung ulang sekali; 429/5xx (tulisan: hanya 429) -> ulang dengan backoff eksponensial ber-jitter, lalu QuotaExceeded
+        bucket = self.buckets["tulis" if write else "baca"]
+        retry_codes = SHEETS_KODE_ULANG_TULIS if write else SHEETS_KODE_ULANG
+        reconnected, attempt = False, 0
+        while True:
+            self.stats["antre_detik"] += bucket.acquire()
+            t0 = time.perf_counter()
+            try:
+                target = self.worksheet(worksheet_name) if worksheet_name else self.spreadsheet()
+                with PROFILER.timer("sheets.api"): return op(target)
+            except gspread.exceptions.APIError as e:
+                self.stats["gagal"] += 1
+                code = getattr(e, 'code', None)
+                if code == 401 and not reconnected:
+                    reconnected = True
+                    self.reset()
+                    continue
+                if code == 429: self.stats["kuota_429"] += 1
+                if code not in retry_codes: raise
+                if attempt >= self.max_retries:
+                    if code == 429: raise QuotaExceeded(f"Kuota Google Sheets habis setelah {attempt + 1} percobaan") from e
+                    raise
+                self.stats["diulang"] += 1
+                delay = min(32.0, self.backoff * 2 ** attempt)
+                time.sleep(delay / 2 + random.uniform(0, delay / 2))
+                attempt += 1
+            finally:
+                self._record(time.perf_counter() - t0)
+
+    def read(self, worksheet_name, op, kind="get_all_records"):
+        # Baca yang identik dan sedang berjalan (dari sesi lain) ditunggu hasilnya, bukan dikirim ulang
+        key = (worksheet_name, kind)
+        with self._inflight_lock:
+            fut = self._inflight.get(key)
+            owner = fut is None
+            if owner: fut = self._inflight[key] = Future()
+            else: self.stats["digabung"] += 1
+        if not owner: return fut.result()
+        try:
+            result = self.run(worksheet_name, op, write=False)
+            fut.set_result(result)
+            return result
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._inflight_lock: self._inflight.pop(key, None)
+
+    def _record(self, elapsed):
+        self.stats["panggilan"] += 1
+        self.stats["latensi_total"] += elapsed
+        self.stats["latensi_terakhir"] = elapsed
+        self.stats["latensi_maks"] = max(self.stats["latensi_maks"], elapsed)
+
+    def summary(self):
+        n = self.stats["panggilan"]
+        return {**self.stats, "latensi_rata2": self.stats["latensi_total"] / n if n else 0.0}
+
+def _authorize():
+    creds_dict = dict(st.secrets["gcp_service_account"])
+    creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, SCOPE)
+    return gspread.authorize(creds)
+
+@st.cache_resource
+def get_sheets_pool():
+    # SHEETS_FAKE=<file.json> menjalankan app di atas fake_sheets tanpa jaringan (untuk uji lokal)
+    fake = get_config("SHEETS_FAKE", "")
+    if fake:
+        import fake_sheets
+        client = fake_sheets.FakeClient(latensi=get_config("SHEETS_FAKE_LATENSI", 0.0), path=fake)
+        return SheetsPool(lambda: client)
+    return SheetsPool()
 
 def connect_db():
     try:
-        creds_dict = dict(st.secrets["gcp_service_account"])
-        creds = ServiceAccountCredentials.from_json_keyfile_dict(creds_dict, SCOPE)
-        client = gspread.authorize(creds)
-        sheet = client.open(SHEET_NAME)
-        return sheet
+        return get_sheets_pool().spreadsheet()
     except Exception as e:
+        get_sheets_pool().reset()
         st.error(f"Error Koneksi: {e}")
         return None
 
-# --- FUNGSI DATABASE (CRUD) ---
-def get_data(worksheet_name):
-    sheet = connect_db()
-    if sheet:
+# --- CACHE BACA WORKSHEET ---
+class SheetCache:
+    # DataFrame per worksheet dibagi antar sesi; kedaluwarsa setelah TTL, dibuang LRU bila melebihi batas memori
+    def __init__(self, ttl, max_bytes):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict() # nama -> (waktu_muat, df, ukuran_byte)
+        self._indexes = {} # nama -> {id: posisi baris 0-based tanpa header}
+        self.stats = {"hit": 0, "miss": 0, "evict": 0, "invalidate": 0}
+
+    def get(self, worksheet_name):
+        with self._lock:
+            entry = self._entries.get(worksheet_name)
+            if entry and time.monotonic() - entry[0] <= self.ttl:
+                self._entries.move_to_end(worksheet_name)
+                self.stats["hit"] += 1
+                return entry[1].copy()
+            self.stats["miss"] += 1
+            return None
+
+    def put(self, worksheet_name, df, stamp=None):
+        # stamp = waktu baca asal data; perubahan lokal di atas entri lama tidak boleh memperpanjang TTL-nya
+        df = df.copy()
+        nbytes = int(df.memory_usage(deep=True).sum())
+        with self._lock:
+            self._entries[worksheet_name] = (time.monotonic() if stamp is None else stamp, df, nbytes)
+            self._indexes.pop(worksheet_name, None)
+            self._entries.move_to_end(worksheet_name)
+            while len(self._entries) > 1 and self.total_bytes() > self.max_bytes:
+                evicted, _ = self._entries.popitem(last=False)
+                self._indexes.pop(evicted, None)
+                self.stats["evict"] += 1
+
+    def is_fresh(self, worksheet_name):
+        with self._lock:
+            entry = self._entries.get(worksheet_name)
+            return entry is not None and time.monotonic() - entry[0] <= self.ttl
+
+    def snapshot(self, worksheet_name):
+        # Hasil baca terakhir walaupun sudah melewati TTL; dipakai sebagai dasar penulisan delta
+        with self._lock:
+            entry = self._entries.get(worksheet_name)
+        return entry[1].copy() if entry else None
+
+    def row_index(self, worksheet_name, key='id'):
+        # Indeks id -> posisi baris, dibangun sekali dari snapshot lalu dirawat saat append/hapus
+        with self._lock:
+            entry = self._entries.get(worksheet_name)
+            if entry is None or key not in entry[1].columns: return None
+            index = self._indexes.get(worksheet_name)
+            if index is None:
+                keys = entry[1][key].astype(str)
+                if keys.duplicated().any(): return None
+                index = self._indexes[worksheet_name] = {k: i for i, k in enumerate(keys)}
+            return index
+
+    def update_cells(self, worksheet_name, pos, values):
+        with self._lock:
+            entry = self._entries.get(worksheet_name)
+            if entry is None: return
+            for col, v in values.items(): entry[1].at[entry[1].index[pos], col] = v
+
+    def remove_rows(self, worksheet_name, positions):
+        with self._lock:
+            entry = self._entries.get(worksheet_name)
+            index = self._indexes.get(worksheet_name)
+        if entry is None: return
+        self.put(worksheet_name, entry[1].drop(index=entry[1].index[list(positions)]).reset_index(drop=True), entry[0])
+        if index is not None:
+            gone, gone_set = sorted(positions), set(positions)
+            shifted = {k: p - bisect.bisect_left(gone, p) for k, p in index.items() if p not in gone_set}
+            with self._lock: self._indexes[worksheet_name] = shifted
+
+    def append(self, worksheet_name, row_data):
+        self.extend(worksheet_name, [row_data])
+
+    def extend(self, worksheet_name, rows):
+        # Perbarui entri di tempat agar penulis langsung melihat barisnya sendiri; entri basi dibuang saja
+        # (baris remote sejak baca terakhir belum terlihat, jadi harus dibaca ulang, bukan diperpanjang)
+        with self._lock:
+            entry = self._entries.get(worksheet_name)
+            index = self._indexes.get(worksheet_name)
+        if entry is None or not rows: return
+        df = entry[1]
+        if time.monotonic() - entry[0] > self.ttl or any(len(r) > len(df.columns) for r in rows) or df.columns.empty:
+            self.invalidate(worksheet_name)
+            return
+        rows = [list(r) + [''] * (len(df.columns) - len(r)) for r in rows]
+        new = pd.concat([df, pd.DataFrame(rows, columns=df.columns)], ignore_index=True)
+        if 'id' in new.columns: new['id'] = new['id'].astype(str)
+        self.put(worksheet_name, new, entry[0])
+        if index is not None and 'id' in new.columns:
+            for pos in range(len(df), len(new)): index.setdefault(new['id'].iat[pos], pos)
+            with self._lock: self._indexes[worksheet_name] = index
+
+    def invalidate(self, worksheet_name=None):
+        with self._lock:
+            if worksheet_name is None: self._entries.clear(); self._indexes.clear()
+            else: self._entries.pop(worksheet_name, None); self._indexes.pop(worksheet_name, None)
+            self.stats["invalidate"] += 1
+
+    def total_bytes(self):
+        return sum(e[2] for e in self._entries.values())
+
+    def summary(self):
+        n = self.stats["hit"] + self.stats["miss"]
+        return {**self.stats, "rasio_hit": self.stats["hit"] / n if n else 0.0, "entri": len(self._entries), "memori": self.total_bytes()}
+
+@st.cache_resource
+def get_sheet_cache():
+    return SheetCache(get_config("CACHE_TTL_DETIK", 60), get_config("CACHE_MAKS_MB", 64) * 1024 * 1024)
+
+# --- PENULISAN DELTA ---
+def _same_value(a, b):
+    na, nb = _is_blank(a), _is_blank(b)
+    if na or nb: return na and nb
+    try: return float(a) == float(b)
+    except (TypeError, ValueError): return str(a) == str(b)
+
+def _norm_value(v):
+    # Bentuk teks kanonik sebuah sel: 60000, 60000.0 dan "60000" dianggap sama
+    if _is_blank(v): return ''
+    try:
+        f = float(v)
+        return str(int(f)) if f.is_integer() else repr(f)
+    except (TypeError, ValueError): return str(v)
+
+def _row_hash(values):
+    return hashlib.sha1("\x1f".join(_norm_value(v) for v in values).encode()).hexdigest()
+
+def _is_blank(v):
+    if v is None or v == '': return True
+    try: return bool(pd.isna(v))
+    except (TypeError, ValueError): return False
+
+def _cell_data(v):
+    # Setara value_input_option RAW: angka tetap angka, selain itu teks apa adanya
+    if hasattr(v, 'item'): v = v.item()
+    if _is_blank(v): return {"userEnteredValue": {"stringValue": ""}}
+    if isinstance(v, bool): return {"userEnteredValue": {"boolValue": v}}
+    if isinstance(v, (int, float)): return {"userEnteredValue": {"numberValue": v}}
+    return {"userEnteredValue": {"stringValue": str(v)}}
+
+def diff_frames(snapshot, edited, key='id'):
+    # Bandingkan df hasil edit dengan snapshot baca terakhir berdasarkan kolom kunci.
+    # Hasil: (updates, appends, deletes) dengan posisi baris 0-based pada snapshot, atau None bila tidak bisa di-diff.
+    if snapshot is None or key not in edited.columns or list(snapshot.columns) != list(edited.columns): return None
+    snap_keys = snapshot[key].astype(str)
+    if snap_keys.duplicated().any(): return None
+    pos_by_key = {k: i for i, k in enumerate(snap_keys)}
+    snap_rows = snapshot.values.tolist()
+    updates, appends, seen = [], [], set()
+    for row in edited.values.tolist():
+        k = row[edited.columns.get_loc(key)]
+        k = None if _is_blank(k) else str(k)
+        if k is None or k not in pos_by_key:
+            appends.append(row)
+            continue
+        if k in seen: return None
+        seen.add(k)
+        pos = pos_by_key[k]
+        changed = [c for c, (old, new) in enumerate(zip(snap_rows[pos], row)) if not _same_value(old, new)]
+        if changed: updates.append((pos, changed[0], row[changed[0]:changed[-1] + 1]))
+    deletes = sorted((pos_by_key[k] for k in pos_by_key if k not in seen), reverse=True)
+    return updates, appends, deletes
+
+def _delta_requests(sheet_id, updates, appends, deletes):
+    # Urutan penting: update memakai nomor baris lama, lalu hapus dari bawah, terakhir tambah di akhir
+    reqs = [{"updateCells": {"range": {"sheetId": sheet_id, "startRowIndex": pos + 1, "endRowIndex": pos + 2, "startColumnIndex": col, "endColumnIndex": col + len(vals)},
+                             "rows": [{"values": [_cell_data(v) for v in vals]}], "fields": "userEnteredValue"}} for pos, col, vals in updates]
+    reqs += [{"deleteDimension": {"range": {"sheetId": sheet_id, "dimension": "ROWS", "startIndex": pos + 1, "endIndex": pos + 2}}} for pos in deletes]
+    if appends:
+        reqs.append({"appendCells": {"sheetId": sheet_id, "rows": [{"values": [_cell_data(v) for v in row]} for row in appends], "fields": "userEnteredValue"}})
+    return reqs
+
+# --- BACKEND PENYIMPANAN ---
+class StorageBackend:
+    # Antarmuka bersama semua backend; nama tabel = nama worksheet, urutan kolom = WORKSHEET_HEADERS
+    name = ""
+    def get_data(self, worksheet_name): raise NotImplementedError
+    def add_row(self, worksheet_name, row_data): raise NotImplementedError
+    def save_all_data(self, worksheet_name, df): raise NotImplementedError
+    def delete_rows_by_ids(self, worksheet_name, ids): raise NotImplementedError
+    def setup(self): raise NotImplementedError
+    def ensure_table(self, worksheet_name): pass
+    def add_rows(self, worksheet_name, rows):
+        for r in rows: self.add_row(worksheet_name, r)
+    def update_fields(self, worksheet_name, key_val, values):
+        # Ubah beberapa kolom pada satu baris (dicari lewat kolom kunci); True bila barisnya ada
+        df = self.get_data(worksheet_name)
+        key = key_column(worksheet_name)
+        mask = df[key].astype(str) == str(key_val)
+        if not mask.any(): return False
+        for col, v in values.items(): df.loc[mask, col] = v
+        self.save_all_data(worksheet_name, df)
+        return True
+    def summary(self): return {}
+
+class SheetsBackend(StorageBackend):
+    name = "sheets"
+
+    def __init__(self, strict=False):
+        # strict=True dipakai thread sinkronisasi: error koneksi dilempar, bukan ditampilkan lalu diabaikan
+        self.strict = strict
+
+    def _open(self):
+        return get_sheets_pool().spreadsheet() if self.strict else connect_db()
+
+    def _open_write(self):
+        # Tulisan yang gagal tersambung harus jadi error, bukan diam-diam tidak tersimpan
+        # (pemanggil memperbarui saldo/indeks turunan setelah tulisan dianggap berhasil)
+        try: return get_sheets_pool().spreadsheet()
+        except Exception as e:
+            get_sheets_pool().reset()
+            raise SheetsUnavailable(f"koneksi gagal, data belum tersimpan: {e}") from e
+
+    def get_data(self, worksheet_name):
+        cache = get_sheet_cache()
+        df = cache.get(worksheet_name)
+        if df is not None: return df
+        sheet = self._open()
+        if not sheet: return self._stale(worksheet_name, "koneksi gagal")
         try:
-            ws = sheet.worksheet(worksheet_name)
-            data = ws.get_all_records()
+            with PROFILER.timer("sheets.get_all_records"):
+                data = get_sheets_pool().read(worksheet_name, lambda ws: ws.get_all_records())
+        except gspread.exceptions.WorksheetNotFound:
+            if self.strict: raise
+            return pd.DataFrame()
+        except Exception as e:
+            if self.strict: raise
+            return self._stale(worksheet_name, e)
+        with PROFILER.timer("sheets.dataframe"):
             df = pd.DataFrame(data)
             if 'id' in df.columns: df['id'] = df['id'].astype(str)
-            return df
-        except: return pd.DataFrame()
-    return pd.DataFrame()
+        cache.put(worksheet_name, df)
+        return df
+
+    def _stale(self, worksheet_name, error):
+        # Gagal baca tidak boleh menjadi df kosong (terbaca sebagai saldo 0): pakai salinan terakhir atau lempar error
+        df = get_sheet_cache().snapshot(worksheet_name)
+        if df is None: raise SheetsUnavailable(f"'{worksheet_name}' tidak bisa dibaca: {error}")
+        st.warning(f"Data '{worksheet_name}' belum bisa diperbarui ({error}); menampilkan salinan terakhir.")
+        return df
+
+    def add_row(self, worksheet_name, row_data):
+        self._open_write()
+        get_sheets_pool().run(worksheet_name, lambda ws: ws.append_row(row_data))
+        get_sheet_cache().append(worksheet_name, row_data)
+
+    def add_rows(self, worksheet_name, rows):
+        if not rows: return
+        self._open_write()
+        get_sheets_pool().run(worksheet_name, lambda ws: ws.append_rows(rows))
+        get_sheet_cache().extend(worksheet_name, rows)
+
+    def _rows_match(self, worksheet_name, snapshot, positions, key='id'):
+        # Posisi dari cache bisa basi (baris dihapus/disisipkan langsung di Sheet):
+        # sebelum menulis per posisi, pastikan baris-baris itu masih memegang kunci yang sama (satu baca kolom kunci)
+        if not positions: return True
+        col = snapshot.columns.get_loc(key)
+        with PROFILER.timer("sheets.col_values"):
+            values = get_sheets_pool().read(worksheet_name, lambda ws: ws.col_values(col + 1), kind=f"col_values:{col}")
+        return all(pos + 1 < len(values) and _norm_value(values[pos + 1]) == _norm_value(snapshot[key].iat[pos]) for pos in positions)
+
+    def save_all_data(self, worksheet_name, df):
+        sheet = self._open_write()
+        cache = get_sheet_cache()
+        for _ in range(2):
+            # Delta hanya dihitung terhadap snapshot yang masih dalam TTL dan posisinya terbukti cocok dengan Sheet
+            if not cache.is_fresh(worksheet_name): self.get_data(worksheet_name)
+            snapshot = cache.snapshot(worksheet_name)
+            diff = diff_frames(snapshot, df)
+            if diff is None or self._rows_match(worksheet_name, snapshot, {pos for pos, _, _ in diff[0]} | set(diff[2])): break
+            cache.invalidate(worksheet_name)
+        else: diff = None
+        if diff is None:
+            values = [df.columns.values.tolist()] + df.values.tolist()
+            def _write(ws):
+                # Tulis dulu baru bersihkan sisa baris/kolom lama, agar data tidak hilang bila gagal di tengah
+                ws.update(range_name='A1', values=values)
+                rest = []
+                if ws.row_count > len(values): rest.append(f"A{len(values) + 1}:{gspread.utils.rowcol_to_a1(ws.row_count, ws.col_count)}")
+                if ws.col_count > len(df.columns): rest.append(f"{gspread.utils.rowcol_to_a1(1, len(df.columns) + 1)}:{gspread.utils.rowcol_to_a1(len(values), ws.col_count)}")
+                if rest: ws.batch_clear(rest)
+        else:
+            def _write(ws):
+                reqs = _delta_requests(ws.id, *diff)
+                if reqs: sheet.batch_update({"requests": reqs})
+        try:
+            get_sheets_pool().run(worksheet_name, _write)
+        except Exception:
+            cache.invalidate(worksheet_name)
+            raise
+        df = df.reset_index(drop=True)
+        if 'id' in df.columns: df['id'] = df['id'].fillna('').astype(str)
+        cache.put(worksheet_name, df)
+
+    def delete_rows_by_ids(self, worksheet_name, ids):
+        # Hapus baris langsung berdasarkan indeks id -> nomor baris; banyak id dikirim dalam satu batch_update
+        ids = {str(i) for i in ids}
+        if not ids: return 0
+        sheet = self._open_write()
+        cache = get_sheet_cache()
+        for _ in range(2):
+            if not cache.is_fresh(worksheet_name): self.get_data(worksheet_name)
+            index = cache.row_index(worksheet_name)
+            if index is None: break
+            positions = sorted((index[i] for i in ids if i in index), reverse=True)
+            if not positions: return 0
+            # Indeks bisa berumur sampai TTL: cek dulu bahwa baris sasaran masih memegang id yang sama
+            if self._rows_match(worksheet_name, cache.snapshot(worksheet_name), positions): break
+            cache.invalidate(worksheet_name)
+        else: index = None
+        if index is None:
+            df = self.get_data(worksheet_name)
+            if 'id' not in df.columns: return 0
+            self.save_all_data(worksheet_name, df[~df['id'].isin(ids)])
+            return int(df['id'].isin(ids).sum())
+        def _delete(ws):
+            if len(positions) == 1: ws.delete_rows(positions[0] + 2)
+            else: sheet.batch_update({"requests": _delta_requests(ws.id, [], [], positions)})
+        try:
+            get_sheets_pool().run(worksheet_name, _delete)
+        except Exception:
+            cache.invalidate(worksheet_name)
+            raise
+        cache.remove_rows(worksheet_name, positions)
+        return len(positions)
+
+    def update_fields(self, worksheet_name, key_val, values):
+        sheet = self._open_write()
+        cache, key = get_sheet_cache(), key_column(worksheet_name)
+        for _ in range(2):
+            if not cache.is_fresh(worksheet_name): self.get_data(worksheet_name)
+            index = cache.row_index(worksheet_name, key)
+            snapshot = cache.snapshot(worksheet_name)
+            if index is None or any(c not in snapshot.columns for c in values):
+                return super().update_fields(worksheet_name, key_val, values)
+            pos = index.get(str(key_val))
+            if pos is None: return False
+            if self._rows_match(worksheet_name, snapshot, [pos], key): break
+            cache.invalidate(worksheet_name)
+        else: raise SheetsUnavailable(f"'{worksheet_name}' sedang diubah bersamaan; coba simpan lagi")
+        updates = [(pos, snapshot.columns.get_loc(c), [v]) for c, v in values.items()]
+        try:
+            get_sheets_pool().run(worksheet_name, lambda ws: sheet.batch_update({"requests": _delta_requests(ws.id, updates, [], [])}))
+        except Exception:
+            cache.invalidate(worksheet_name)
+            raise
+        cache.update_cells(worksheet_name, pos, values)
+        return True
+
+    def ensure_table(self, worksheet_name):
+        # Worksheet yang ditambahkan versi baru (mis. arisan_log) dibuat saat pertama dipakai, tanpa menunggu "Buat Header"
+        self._open_write()
+        pool = get_sheets_pool()
+        try: pool.worksheet(worksheet_name)
+        except gspread.exceptions.WorksheetNotFound:
+            headers = WORKSHEET_HEADERS[worksheet_name]
+            pool.run(None, lambda sh: sh.add_worksheet(worksheet_name, 100, len(headers)))
+            pool.run(worksheet_name, lambda ws: ws.update(range_name='A1', values=[headers]))
+            get_sheet_cache().invalidate(worksheet_name)
+
+    def setup(self):
+        pool = get_sheets_pool()
+        for s in ["tunggakan", "arisan_peserta", "arisan_bayar", "kategori", "arisan_log", "warga", "arsip_transaksi", "arsip_manifest"]:
+            try: pool.run(None, lambda sh: sh.add_worksheet(s, 100, 10))
+            except gspread.exceptions.APIError: pass
+            pool.run(s, lambda ws: ws.update(range_name='A1', values=[WORKSHEET_HEADERS[s]]))
+        get_sheet_cache().invalidate()
+
+    def summary(self):
+        return {"pool": get_sheets_pool().summary(), "cache": get_sheet_cache().summary()}
+
+class SQLiteBackend(StorageBackend):
+    # Penyimpanan lokal: latensi disk, tetap jalan tanpa internet
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self.stats = {"query": 0, "latensi_total": 0.0}
+        self.setup()
+
+    def _table(self, worksheet_name):
+        if worksheet_name not in SQLITE_SCHEMA: raise KeyError(f"Tabel tidak dikenal: {worksheet_name}")
+        return worksheet_name
 
+    def _columns(self, table):
+        return [r[1] for r in self._conn.execute(f'PRAGMA table_info("{table}")')]
+
+    def _run(self, fn):
+        t0 = time.perf_counter()
+        try:
+            with self._lock, PROFILER.timer("sqlite.query"): return fn(self._conn)
+        finally:
+            self.stats["query"] += 1
+            self.stats["latensi_total"] += time.perf_counter() - t0
+
+    def get_data(self, worksheet_name):
+        try: table = self._table(worksheet_name)
+        except KeyError: return pd.DataFrame()
+        df = self._run(lambda c: pd.read_sql_query(f'SELECT * FROM "{table}" ORDER BY rowid', c))
+        if 'id' in df.columns: df['id'] = df['id'].astype(str)
+        return df
+
+    def add_row(self, worksheet_name, row_data):
+        self.add_rows(worksheet_name, [row_data])
+
+    def add_rows(self, worksheet_name, rows):
+        if not rows: return
+        table = self._table(worksheet_name)
+        cols = self._columns(table)[:max(len(r) for r in rows)]
+        sql = f'INSERT INTO "{table}" ({", ".join(cols)}) VALUES ({", ".join("?" * len(cols))})'
+        values = [[_sql_value(v) for v in r] + [None] * (len(cols) - len(r)) for r in rows]
+        def _insert(c):
+            with c: c.executemany(sql, values)
+        self._run(_insert)
+
+    def upsert_rows(self, worksheet_name, df):
+        table = self._table(worksheet_name)
+        cols = [c for c in df.columns if c in self._columns(table)]
+        sql = f'INSERT OR REPLACE INTO "{table}" ({", ".join(cols)}) VALUES ({", ".join("?" * len(cols))})'
+        rows = [[_sql_value(v) for v in r] for r in df[cols].values.tolist()]
+        def _upsert(c):
+            with c: c.executemany(sql, rows)
+        self._run(_upsert)
+
+    def save_all_data(self, worksheet_name, df):
+        # Ganti isi tabel dalam satu transaksi: gagal di tengah = tidak ada yang berubah
+        table = self._table(worksheet_name)
+        cols = [c for c in df.columns if c in self._columns(table)]
+        rows = [[_sql_value(v) for v in r] for r in df[cols].values.tolist()]
+        sql = f'INSERT INTO "{table}" ({", ".join(cols)}) VALUES ({", ".join("?" * len(cols))})'
+        def _replace(c):
+            with c:
+                c.execute(f'DELETE FROM "{table}"')
+                c.executemany(sql, rows)
+        self._run(_replace)
+
+    def update_fields(self, worksheet_name, key_val, values):
+        table = self._table(worksheet_name)
+        cols = self._columns(table)
+        if any(c not in cols for c in values): raise KeyError(f"Kolom tidak dikenal: {list(values)}")
+        sql = f'UPDATE "{table}" SET {", ".join(f"{c} = ?" for c in values)} WHERE CAST({key_column(table)} AS TEXT) = ?'
+        def _update(c):
+            with c: return c.execute(sql, [_sql_value(v) for v in values.values()] + [str(key_val)]).rowcount
+        return bool(self._run(_update))
+
+    def delete_rows_by_ids(self, worksheet_name, ids):
+        table = self._table(worksheet_name)
+        ids = [str(i) for i in ids]
+        if not ids: return 0
+        key = key_column(table)
+        def _delete(c):
+            with c: return c.execute(f'DELETE FROM "{table}" WHERE CAST({key} AS TEXT) IN ({", ".join("?" * len(ids))})', ids).rowcount
+        return self._run(_delete)
+
+    def setup(self):
+        with self._lock, self._conn as c:
+            for table, schema in SQLITE_SCHEMA.items():
+                c.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({schema})')
+                id_col = c.execute(f'PRAGMA table_info("{table}")').fetchone()
+                if id_col[1] == 'id' and id_col[2].upper() == 'INTEGER' and 'TEXT' in schema.split(',')[0]:
+                    # Tabel lama memakai id INTEGER, sedangkan aplikasi memakai id teks (uuid 8 karakter)
+                    cols = ", ".join(self._columns(table))
+                    c.execute(f'ALTER TABLE "{table}" RENAME TO "{table}_lama"')
+                    c.execute(f'CREATE TABLE "{table}" ({schema})')
+                    c.execute(f'INSERT INTO "{table}" ({cols}) SELECT CAST(id AS TEXT), {cols.split(", ", 1)[1]} FROM "{table}_lama"')
+                    c.execute(f'DROP TABLE "{table}_lama"')
+                existing = set(self._columns(table))
+                for col_def in schema.split(", "):
+                    if col_def.split()[0] not in existing: c.execute(f'ALTER TABLE "{table}" ADD COLUMN {col_def}')
+            for sql in SQLITE_INDEXES: c.execute(sql)
+
+    def summary(self):
+        n = self.stats["query"]
+        return {**self.stats, "latensi_rata2": self.stats["latensi_total"] / n if n else 0.0}
+
+def _sql_value(v):
+    if hasattr(v, 'item'): v = v.item()
+    if _is_blank(v): return None
+    if isinstance(v, datetime): return v.isoformat(sep=' ')
+    if isinstance(v, date): return v.isoformat()
+    return v
+
+# --- SINKRONISASI LOKAL <-> GOOGLE SHEETS ---
+class SyncEngine:
+    # Write-behind: tulisan lokal diantrikan lalu dikirim ke Sheets berkelompok dari thread latar.
+    # Sheet tetap sumber kebenaran bersama; perubahan remote ditarik dan digabung per id.
+    def __init__(self, local, remote, interval):
+        self.local, self.remote, self.interval = local, remote, interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._queue = [] # (op, worksheet, payload) dengan op = add | save | delete
+        self._base = {} # worksheet -> {kunci: hash baris saat terakhir sama dengan remote}
+        self._dirty = {} # worksheet -> {kunci: waktu ubah lokal yang belum terkirim}
+        self._last_pull = {}
+        self._retry = set() # worksheet yang push terakhirnya gagal: tulisan bisa saja sudah sampai di remote
+        self.status = {"terakhir_sync": None, "gagal": 0, "gagal_beruntun": 0, "error": "", "terkirim": 0, "ditarik": 0}
+        threading.Thread(target=self._loop, name="rt-sync", daemon=True).start()
+
+    def enqueue(self, op, worksheet_name, payload, keys):
+        now = time.time()
+        with self._lock:
+            self._queue.append((op, worksheet_name, payload))
+            dirty = self._dirty.setdefault(worksheet_name, {})
+            for k in keys: dirty[str(k)] = now
+        self._wake.set()
+
+    def queue_depth(self):
+        with self._lock: return len(self._queue)
+
+    def _loop(self):
+        next_pull = 0.0
+        while True:
+            self._wake.wait(self.interval)
+            time.sleep(SYNC_DEBOUNCE_DETIK) # kumpulkan tulisan yang datang berdekatan menjadi satu batch
+            self._wake.clear()
+            try:
+                with self._lock: need_pull = any(op == "save" for op, _, _ in self._queue)
+                if need_pull or time.monotonic() >= next_pull:
+                    self.pull()
+                    next_pull = time.monotonic() + self.interval
+                self.push()
+                self.status.update(terakhir_sync=datetime.now(), gagal_beruntun=0, error="")
+            except Exception as e:
+                self.status["gagal"] += 1
+                self.status["gagal_beruntun"] += 1
+                self.status["error"] = str(e)
+                time.sleep(min(300, 2 ** self.status["gagal_beruntun"]))
+
+    def push(self):
+        with self._lock: ops, self._queue = self._queue, []
+        groups = OrderedDict()
+        for op, ws, payload in ops: groups.setdefault(ws, []).append((op, payload))
+        pending = list(groups.items())
+        while pending:
+            ws, group = pending[0]
+            try: self._push_worksheet(ws, group)
+            except Exception:
+                # Kembalikan sisa antrean ke depan agar urutan tulisan tetap terjaga; op yang sudah terkirim sudah dibuang dari group
+                with self._lock: self._queue = [(op, w, p) for w, g in pending for op, p in g] + self._queue
+                self._retry.add(ws)
+                raise
+            self._retry.discard(ws)
+            pending.pop(0)
+
+    def _push_worksheet(self, ws, group):
+        # Setiap langkah yang berhasil langsung dibuang dari group (dan kuncinya tidak lagi dirty), jadi bila
+        # langkah berikutnya gagal hanya sisanya yang diantrekan ulang: add yang sudah terkirim tidak dikirim dua kali
+        started, n = time.time(), len(group)
+        try: self._push_steps(ws, group, started)
+        finally: self.status["terkirim"] += n - len(group)
+
+    def _push_steps(self, ws, group, started):
+        self.remote.ensure_table(ws)
+        headers, key = WORKSHEET_HEADERS[ws], key_column(ws)
+        if any(op == "save" for op, _ in group):
+            # Satu kali simpan memuat semua tulisan lain; writer delta hanya mengirim sel yang berubah
+            df = self.local.get_data(ws)
+            self.remote.save_all_data(ws, df)
+            pushed = {str(k): _row_hash(r) for k, r in zip(df[key], df.reindex(columns=headers).values.tolist())}
+            with self._lock: self._base[ws] = pushed
+            group[:] = []
+            self._sent(ws, pushed, started)
+        else:
+            deleted = {str(k) for op, p in group if op == "delete" for k in p}
+            adds = [p for op, p in group if op == "add"]
+            added = {str(r[headers.index(key)]) for r in adds}
+            adds = [r for r in adds if str(r[headers.index(key)]) not in deleted]
+            updates = OrderedDict()
+            for op, p in group:
+                if op == "update" and str(p[0]) not in deleted: updates.setdefault(str(p[0]), {}).update(p[1])
+            if adds and ws in self._retry:
+                # Push sebelumnya gagal: add bisa saja sudah diterapkan remote walau error, lewati kunci yang sudah ada
+                get_sheet_cache().invalidate(ws)
+                remote = self.remote.get_data(ws)
+                present = set(remote[key].astype(str)) if key in remote.columns else set()
+                adds = [r for r in adds if str(r[headers.index(key)]) not in present]
+            if adds: self.remote.add_rows(ws, adds)
+            group[:] = [(op, p) for op, p in group if op != "add"]
+            with self._lock:
+                base = self._base.setdefault(ws, {})
+                for r in adds: base[str(r[headers.index(key)])] = _row_hash(list(r) + [''] * (len(headers) - len(r)))
+            self._sent(ws, added - deleted - set(updates), started)
+            for k, values in updates.items():
+                self.remote.update_fields(ws, k, values)
+                group[:] = [(op, p) for op, p in group if not (op == "update" and str(p[0]) == k)]
+                self._sent(ws, [k], started)
+            if deleted - added: self.remote.delete_rows_by_ids(ws, deleted - added)
+            group[:] = []
+            with self._lock:
+                for k in deleted: base.pop(k, None)
+            self._sent(ws, deleted, started)
+            if updates:
+                local = self.local.get_data(ws)
+                local = local[local[key].astype(str).isin(updates)]
+                with self._lock: base.update(zip(local[key].astype(str), map(_row_hash, local.reindex(columns=headers).values.tolist())))
+
+    def _sent(self, ws, keys, started):
+        # Kunci yang sudah sampai di remote tidak lagi dirty, kecuali diubah lagi setelah push dimulai
+        with self._lock:
+            dirty = self._dirty.get(ws, {})
+            for k in keys:
+                if dirty.get(k, started + 1) <= started: dirty.pop(k)
+
+    def pull(self):
+        for ws in WORKSHEET_HEADERS:
+            get_sheet_cache().invalidate(ws)
+            try: remote = self.remote.get_data(ws)
+            except gspread.exceptions.WorksheetNotFound: continue
+            self._merge(ws, remote)
+
+    def _merge(self, ws, remote):
+        key = key_column(ws)
+        if key not in remote.columns: return
+        remote = remote[remote[key].astype(str) != ''].reset_index(drop=True)
+        cols = [c for c in WORKSHEET_HEADERS[ws] if c in remote.columns]
+        local = self.local.get_data(ws)
+        with self._lock:
+            base = self._base.get(ws, {})
+            dirty = dict(self._dirty.get(ws, {}))
+            last_pull = self._last_pull.get(ws, 0.0)
+        remote_keys = remote[key].astype(str).tolist()
+        remote_hash = dict(zip(remote_keys, map(_row_hash, remote.reindex(columns=WORKSHEET_HEADERS[ws]).values.tolist())))
+        local_hash = {}
+        if key in local.columns:
+            local_hash = dict(zip(local[key].astype(str), map(_row_hash, local.reindex(columns=WORKSHEET_HEADERS[ws]).values.tolist())))
+        # Waktu ubah remote: kolom updated_at bila ada, selain itu paling awal sejak tarikan sebelumnya
+        remote_time = {}
+        if 'updated_at' in remote.columns:
+            stamps = pd.to_datetime(remote['updated_at'], errors='coerce')
+            remote_time = {k: t.timestamp() for k, t in zip(remote_keys, stamps) if not pd.isna(t)}
+        def local_wins(k): return k in dirty and dirty[k] > remote_time.get(k, last_pull)
+        # Ambil versi remote bila berbeda dan memang berubah di remote (atau hilang di lokal), kecuali lokal lebih baru
+        take = [i for i, k in enumerate(remote_keys) if remote_hash[k] != local_hash.get(k) and not local_wins(k) and (k not in local_hash or remote_hash[k] != base.get(k))]
+        # Baris lokal yang tidak ada di remote: dihapus, kecuali baris baru yang belum terkirim atau hapusan remote yang lebih lama
+        drop = [k for k in local_hash if k not in remote_hash and not (k in dirty and (k not in base or local_wins(k)))]
+        if take: self.local.upsert_rows(ws, remote.iloc[sorted(set(take))][cols])
+        if drop: self.local.delete_rows_by_ids(ws, drop)
+        if take or drop: _after_write(ws)
+        with self._lock:
+            self._base[ws] = remote_hash
+            self._last_pull[ws] = time.time()
+            for k in [remote_keys[i] for i in take] + drop: self._dirty.get(ws, {}).pop(k, None)
+        self.status["ditarik"] += len(take) + len(drop)
+
+    def summary(self):
+        return {**self.status, "antrean": self.queue_depth()}
+
+class SyncedBackend(StorageBackend):
+    # Baca/tulis ke SQLite lokal (tidak pernah menunggu Sheets), lalu SyncEngine menyusul ke Sheets
+    name = "sync"
+
+    def __init__(self, local, remote, interval):
+        self.local, self.remote = local, remote
+        self.path = local.path
+        self.engine = SyncEngine(local, remote, interval)
+
+    def get_data(self, worksheet_name): return self.local.get_data(worksheet_name)
+
+    def add_row(self, worksheet_name, row_data): self.add_rows(worksheet_name, [row_data])
+
+    def add_rows(self, worksheet_name, rows):
+        self.local.add_rows(worksheet_name, rows)
+        pos = WORKSHEET_HEADERS[worksheet_name].index(key_column(worksheet_name))
+        for r in rows: self.engine.enqueue("add", worksheet_name, list(r), [r[pos]] if len(r) > pos else [])
+
+    def save_all_data(self, worksheet_name, df):
+        key = key_column(worksheet_name)
+        # Kolom turunan diabaikan: pengisian periode_key tidak boleh menandai baris dirty dan mengalahkan edit remote
+        headers = [c for c in WORKSHEET_HEADERS[worksheet_name] if c not in DERIVED_COLUMNS.get(worksheet_name, ())]
+        before = self.local.get_data(worksheet_name)
+        self.local.save_all_data(worksheet_name, df)
+        old = dict(zip(before[key].astype(str), map(_row_hash, before.reindex(columns=headers).values.tolist()))) if key in before.columns else {}
+        new = dict(zip(df[key].astype(str), map(_row_hash, df.reindex(columns=headers).values.tolist()))) if key in df.columns else {}
+        changed = [k for k in old.keys() | new.keys() if old.get(k) != new.get(k)]
+        self.engine.enqueue("save", worksheet_name, None, changed)
+
+    def update_fields(self, worksheet_name, key_val, values):
+        ok = self.local.update_fields(worksheet_name, key_val, values)
+        if ok: self.engine.enqueue("update", worksheet_name, (str(key_val), dict(values)), [key_val])
+        return ok
+
+    def delete_rows_by_ids(self, worksheet_name, ids):
+        ids = [str(i) for i in ids]
+        n = self.local.delete_rows_by_ids(worksheet_name, ids)
+        if n: self.engine.enqueue("delete", worksheet_name, ids, ids)
+        return n
+
+    def ensure_table(self, worksheet_name): self.local.ensure_table(worksheet_name)
+
+    def setup(self):
+        self.local.setup()
+        self.remote.setup()
+
+    def summary(self): return {**self.local.summary(), "sync": self.engine.summary()}
+
+@st.cache_resource
+def _open_backend(name, sqlite_path):
+    if name == "sqlite": return SQLiteBackend(sqlite_path)
+    if name == "sync": return SyncedBackend(SQLiteBackend(sqlite_path), SheetsBackend(strict=True), get_config("SYNC_INTERVAL_DETIK", 30))
+    return SheetsBackend()
+
+def get_backend():
+    # Dipilih lewat config STORAGE_BACKEND = "sheets" (default), "sqlite", atau "sync" (SQLite + write-behind ke Sheets)
+    return _open_backend(get_config("STORAGE_BACKEND", "sheets"), get_config("SQLITE_PATH", "keuangan_rt.db"))
+
+# --- KONTEKS RERUN ---
+class RerunContext:
+    # Satu eksekusi skrip Streamlit: worksheet yang sudah dibaca dipakai ulang, jumlah baca dicatat per worksheet
+    def __init__(self):
+        self.frames = {}
+        self.fetches = {}
+        self.reuses = {}
+        self.timings = {} # nama timer -> [jumlah, total detik] selama rerun ini
+
+    def get(self, worksheet_name, load):
+        if worksheet_name in self.frames: self.reuses[worksheet_name] = self.reuses.get(worksheet_name, 0) + 1
+        else:
+            with PROFILER.timer(f"fetch.{worksheet_name}"): self.frames[worksheet_name] = load(worksheet_name)
+            self.fetches[worksheet_name] = self.fetches.get(worksheet_name, 0) + 1
+        return self.frames[worksheet_name].copy()
+
+    def invalidate(self, worksheet_name):
+        self.frames.pop(worksheet_name, None)
+
+@st.cache_resource
+def _rerun_local():
+    # Satu objek thread-local untuk seluruh proses: tiap sesi Streamlit menjalankan skripnya di thread sendiri
+    return threading.local()
+
+RERUN_LOCAL = _rerun_local()
+
+def current_rerun():
+    return getattr(RERUN_LOCAL, "ctx", None)
+
+@contextmanager
+def rerun_scope():
+    RERUN_LOCAL.ctx = RerunContext()
+    try: yield RERUN_LOCAL.ctx
+    finally: RERUN_LOCAL.ctx = None
+
+# --- FUNGSI DATABASE (CRUD) ---
+@timed("storage.get_data")
+def get_data(worksheet_name):
+    ctx = current_rerun()
+    return ctx.get(worksheet_name, get_backend().get_data) if ctx else get_backend().get_data(worksheet_name)
+
+@timed("storage.add_row")
 def add_row(worksheet_name, row_data):
-    sheet = connect_db()
-    if sheet:
-        ws = sheet.worksheet(worksheet_name)
-        ws.append_row(row_data)
+    if worksheet_name == "tunggakan": row_data = with_periode_key(row_data)
+    get_backend().add_row(worksheet_name, row_data)
+    _after_write(worksheet_name, added=_rows_frame(worksheet_name, [row_data]))
+
+@timed("storage.add_rows")
+def add_rows(worksheet_name, rows):
+    if not rows: return
+    if worksheet_name == "tunggakan": rows = [with_periode_key(r) for r in rows]
+    get_backend().add_rows(worksheet_name, rows)
+    _after_write(worksheet_name, added=_rows_frame(worksheet_name, rows))
 
+@timed("storage.save_all_data")
 def save_all_data(worksheet_name, df):
-    sheet = connect_db()
-    if sheet:
-        ws = sheet.worksheet(worksheet_name)
-        ws.clear()
-        ws.update(range_name='A1', values=[df.columns.values.tolist()] + df.values.tolist())
+    if worksheet_name == "tunggakan" and 'periode' in df.columns: df = df.assign(periode_key=df['periode'].map(periode_key))
+    get_backend().save_all_data(worksheet_name, df)
+    _after_write(worksheet_name, replaced=df)
 
-def delete_row_by_id(worksheet_name, id_val):
-    df = get_data(worksheet_name)
-    df = df[df['id'] != str(id_val)]
-    save_all_data(worksheet_name, df)
+@timed("storage.delete_rows")
+def delete_rows_by_ids(worksheet_name, ids):
+    removed = None
+    if worksheet_name in DERIVED_WORKSHEETS:
+        df = get_data(worksheet_name)
+        if 'id' in df.columns: removed = df[df['id'].isin({str(i) for i in ids})]
+    n = get_backend().delete_rows_by_ids(worksheet_name, ids)
+    if n: _after_write(worksheet_name, removed=removed)
+    return n
 
-# --- LOGIKA ARISAN ---
-def kocok_pemenang():
+def delete_row_by_id(worksheet_name, id_val): return delete_rows_by_ids(worksheet_name, [id_val])
+
+@timed("storage.update_fields")
+def update_fields(worksheet_name, key_val, values):
+    ok = get_backend().update_fields(worksheet_name, key_val, values)
+    if ok: _after_write(worksheet_name)
+    return ok
+
+def _rows_frame(worksheet_name, rows):
+    headers = WORKSHEET_HEADERS.get(worksheet_name)
+    if not headers: return None
+    return pd.DataFrame([list(r)[:len(headers)] + [''] * (len(headers) - len(r)) for r in rows], columns=headers)
+
+def _after_write(worksheet_name, added=None, removed=None, replaced=None):
+    # Rawat struktur turunan tanpa membaca ulang worksheet; tanpa argumen = perubahan tak diketahui (mis. tarikan sync)
+    ctx = current_rerun()
+    if ctx: ctx.invalidate(worksheet_name)
+    get_typed_tables().invalidate(worksheet_name)
+    if worksheet_name == "tunggakan": get_tunggakan_index().apply(added, removed, replaced)
+    if worksheet_name == "arisan_peserta": get_draw_engine().invalidate()
+    if worksheet_name == "users": get_user_directory().invalidate()
+    if worksheet_name in ("transaksi", "warga"): get_payment_matrix().apply(worksheet_name, added, removed, replaced)
+    if worksheet_name in DERIVED_WORKSHEETS:
+        get_summary_store().apply(worksheet_name, added, removed, replaced)
+
+# --- RINGKASAN DASHBOARD ---
+class SummaryStore:
+    # Total kas dan bucket (tahun, bulan, tipe) yang diperbarui bertahap, sehingga dashboard membaca O(bulan) nilai
+    def __init__(self, max_age):
+        self.max_age = max_age
+        self._lock = threading.RLock()
+        self._ready = False
+        self._built_at = 0.0
+        self.totals = {} # tipe -> total nominal
+        self.buckets = {} # (tahun, bulan, tipe) -> total nominal
+        self.count = 0
+        self.tunggakan_total = 0.0
+
+    def invalidate(self):
+        with self._lock: self._ready = False
+
+    def ensure(self, load):
+        # Dibangun ulang bila belum ada atau sudah terlalu tua (menangkap edit langsung di Sheet oleh pihak lain)
+        with self._lock:
+            if not self._ready or time.monotonic() - self._built_at > self.max_age: self.rebuild(load)
+            return self
+
+    def rebuild(self, load):
+        with self._lock:
+            before = self.snapshot() if self._ready else None
+            self.totals, self.buckets, self.count = {}, {}, 0
+            self._add_transaksi(load("transaksi"), 1)
+            self._add_arsip()
+            self.tunggakan_total = self._tunggakan_sum(load("tunggakan"))
+            self._ready, self._built_at = True, time.monotonic()
+            after = self.snapshot()
+            return before is None or all(abs(before[k] - after[k]) < 0.5 for k in after)
+
+    def apply(self, worksheet_name, added=None, removed=None, replaced=None):
+        with self._lock:
+            if not self._ready: return
+            if added is None and removed is None and replaced is None:
+                self._ready = False
+            elif worksheet_name == "transaksi":
+                if replaced is not None:
+                    self.totals, self.buckets, self.count = {}, {}, 0
+                    self._add_transaksi(replaced, 1)
+                    self._add_arsip()
+                if added is not None: self._add_transaksi(added, 1)
+                if removed is not None: self._add_transaksi(removed, -1)
+            elif worksheet_name == "tunggakan":
+                if replaced is not None: self.tunggakan_total = self._tunggakan_sum(replaced)
+                if added is not None: self.tunggakan_total += self._tunggakan_sum(added)
+                if removed is not None: self.tunggakan_total -= self._tunggakan_sum(removed)
+
+    def _add_transaksi(self, df, sign):
+        if df is None or df.empty or 'tipe' not in df.columns: return
+        nominal = pd.to_numeric(df['nominal'], errors='coerce').fillna(0) * sign
+        tanggal = pd.to_datetime(df['tanggal'], errors='coerce')
+        for tipe, total in nominal.groupby(df['tipe']).sum().items():
+            self.totals[tipe] = self.totals.get(tipe, 0) + total
+        grouped = nominal.groupby([tanggal.dt.year, tanggal.dt.month, df['tipe']]).sum()
+        for (tahun, bulan, tipe), total in grouped.items():
+            key = (int(tahun), int(bulan), tipe)
+            self.buckets[key] = self.buckets.get(key, 0) + total
+        self.count += len(df) * sign
+
+    def _add_arsip(self):
+        # Periode tutup buku: total diambil dari manifest arsip, bukan dari baris live
+        arsip = get_arsip()
+        for (tahun, bulan, tipe), total in arsip.buckets().items():
+            self.totals[tipe] = self.totals.get(tipe, 0) + total
+            self.buckets[(tahun, bulan, tipe)] = self.buckets.get((tahun, bulan, tipe), 0) + total
+        self.count += arsip.row_count()
+
+    def _tunggakan_sum(self, df):
+        if df is None or df.empty or 'status' not in df.columns: return 0.0
+        return float(pd.to_numeric(df.loc[df['status'] == 'Belum Lunas', 'nominal'], errors='coerce').fillna(0).sum())
+
+    def snapshot(self):
+        pemasukan, pengeluaran = self.totals.get('Pemasukan', 0), self.totals.get('Pengeluaran', 0)
+        return {"pemasukan": pemasukan, "pengeluaran": pengeluaran, "saldo": pemasukan - pengeluaran,
+                "tunggakan": self.tunggakan_total, "jumlah_transaksi": self.count}
+
+    def monthly(self, year):
+        with self._lock:
+            rows = {(f"{y}-{m:02d}", tipe): v for (y, m, tipe), v in self.buckets.items() if y == year and v}
+        if not rows: return pd.DataFrame(columns=['Pemasukan', 'Pengeluaran'])
+        chart = pd.Series(rows).unstack().fillna(0).sort_index()
+        return chart.reindex(columns=['Pemasukan', 'Pengeluaran'], fill_value=0)
+
+@st.cache_resource
+def get_summary_store():
+    return SummaryStore(get_config("RINGKASAN_MAKS_UMUR_DETIK", 600))
+
+# --- DATA BERTIPE ---
+WORKSHEET_SCHEMA = {
+    "transaksi": {"tanggal": "datetime", "nominal": "int64", "tipe": ("Pemasukan", "Pengeluaran")},
+    "tunggakan": {"nominal": "int64", "status": ("Belum Lunas", "Lunas")},
+    "arisan_bayar": {"tanggal_bayar": "datetime", "nominal": "int64", "status_bayar": ("Lunas", "Belum Lunas")},
+}
+DATE_COLUMNS = {"transaksi": "tanggal", "arisan_bayar": "tanggal_bayar"}
+
+def apply_schema(worksheet_name, df):
+    # Beri tipe sesuai WORKSHEET_SCHEMA tanpa mengubah df asal; nilai yang gagal dibaca dilaporkan per baris
+    df = df.copy()
+    errors = []
+    for col, tipe in WORKSHEET_SCHEMA.get(worksheet_name, {}).items():
+        if col not in df.columns: continue
+        raw = df[col]
+        blank = raw.isna() | (raw.astype(str).str.strip() == '')
+        if tipe == "datetime": val = pd.to_datetime(raw.where(~blank), errors='coerce', format='mixed')
+        elif tipe == "int64": val = pd.to_numeric(raw.where(~blank), errors='coerce').round().astype('Int64')
+        else: val = pd.Series(pd.Categorical(raw.where(~blank), categories=list(tipe)), index=df.index)
+        bad = val.isna() & ~blank
+        errors += [f"baris {i + 2}: {col} = {v!r}" for i, v in raw[bad].items()]
+        df[col] = val
+    return df, errors
+
+class TypedTable:
+    # Worksheet bertipe yang diurutkan menurut kolom tanggal, sehingga potongan per bulan cukup binary search
+    def __init__(self, worksheet_name, df):
+        self.date_col = DATE_COLUMNS.get(worksheet_name)
+        if self.date_col and self.date_col not in df.columns:
+            # Worksheet yang baru berisi header: get_all_records() kosong tanpa kolom
+            df = pd.DataFrame(columns=WORKSHEET_HEADERS.get(worksheet_name, [self.date_col]))
+        typed, self.errors = apply_schema(worksheet_name, df)
+        self._n_dates = 0
+        if self.date_col in typed.columns:
+            typed = typed.sort_values(self.date_col, kind='stable', na_position='last').reset_index(drop=True)
+            self._n_dates = int(typed[self.date_col].notna().sum())
+        self.df = typed
+
+    def between(self, start, end):
+        # Baris dengan start <= tanggal < end
+        dates = self.df[self.date_col].iloc[:self._n_dates]
+        return self.df.iloc[dates.searchsorted(start, 'left'):dates.searchsorted(end, 'left')]
+
+    def month(self, year, month):
+        start = pd.Timestamp(int(year), int(month), 1)
+        return self.between(start, start + pd.offsets.MonthBegin(1))
+
+    def year(self, year):
+        return self.between(pd.Timestamp(int(year), 1, 1), pd.Timestamp(int(year) + 1, 1, 1))
+
+class TypedTableCache:
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._tables = {}
+
+    def get(self, worksheet_name, build):
+        with self._lock:
+            entry = self._tables.get(worksheet_name)
+        if entry and time.monotonic() - entry[0] <= self.ttl: return entry[1]
+        table = build()
+        with self._lock: self._tables[worksheet_name] = (time.monotonic(), table)
+        return table
+
+    def invalidate(self, worksheet_name=None):
+        with self._lock:
+            if worksheet_name is None: self._tables.clear()
+            else: self._tables.pop(worksheet_name, None)
+
+@st.cache_resource
+def get_typed_tables():
+    return TypedTableCache(get_config("CACHE_TTL_DETIK", 60))
+
+def load_typed(worksheet_name):
+    return get_typed_tables().get(worksheet_name, lambda: TypedTable(worksheet_name, get_data(worksheet_name)))
+
+def show_parse_errors(table, worksheet_name):
+    if table.errors:
+        st.warning(f"{len(table.errors)} nilai di worksheet '{worksheet_name}' tidak bisa dibaca dan tidak ikut dihitung: " + "; ".join(table.errors[:5]) + (" ..." if len(table.errors) > 5 else ""))
+
+# --- ARSIP TUTUP BUKU ---
+ARSIP_DIR = get_config("ARSIP_DIR", "arsip")
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.feather as feather
+    except ImportError:
+        raise ImportError("Tutup buku membutuhkan paket pyarrow (pip install pyarrow).")
+    return pa, feather
+
+def periode_bulan(periode):
+    # "2025" -> ["2025-01", ..., "2025-12"], "2025-10" -> ["2025-10"]
+    m = re.fullmatch(r"(\d{4})(?:-(\d{2}))?", str(periode).strip())
+    if not m or (m[2] and not 1 <= int(m[2]) <= 12): raise ValueError(f"Periode tidak valid: {periode!r} (gunakan YYYY atau YYYY-MM)")
+    return [f"{m[1]}-{m[2]}"] if m[2] else [f"{m[1]}-{b:02d}" for b in range(1, 13)]
+
+class Arsip:
+    # Snapshot transaksi per periode yang sudah ditutup: file Feather (Arrow IPC, zstd) read-only, dibaca lewat memory map.
+    # manifest.json menyimpan posisi baris per bulan dan total per (bulan, tipe), sehingga ringkasan tidak perlu membuka file.
+    # Salinan tahan lama ada di worksheet arsip_transaksi/arsip_manifest; folder lokal hanya cache yang bisa dibangun ulang.
+    def __init__(self, folder, ttl):
+        self.folder = folder
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._tables = {} # nama file -> pyarrow.Table
+        self._checked_at = None
+        try:
+            with open(os.path.join(folder, "manifest.json")) as f: self.manifest = json.load(f)
+        except FileNotFoundError: self.manifest = []
+
+    def ensure(self, load, force=False):
+        # Periode yang ditutup instance lain (atau sebelum disk lokal hilang) dibangun ulang dari worksheet arsip
+        with self._lock:
+            if not force and self._checked_at is not None and time.monotonic() - self._checked_at <= self.ttl: return self
+            self._checked_at = time.monotonic()
+            durable = load("arsip_manifest")
+            local = {e["periode"] for e in self.manifest}
+            missing = [r for r in durable.to_dict('records') if str(r['periode']) not in local] if 'periode' in durable.columns else []
+            if missing:
+                rows = load("arsip_transaksi")
+                for r in sorted(missing, key=lambda r: str(r['periode'])):
+                    periode = str(r['periode'])
+                    raw = rows[rows['periode_arsip'].astype(str) == periode].drop(columns='periode_arsip')
+                    self.freeze(periode, TypedTable("transaksi", raw).df, r['ditutup_oleh'])
+                get_summary_store().invalidate()
+                get_payment_matrix().invalidate()
+            return self
+
+    def closed_months(self):
+        return {b: e for e in self.manifest for b in e["bulan"]}
+
+    def entry_for(self, year, month):
+        return self.closed_months().get(f"{int(year):04d}-{int(month):02d}")
+
+    def row_count(self):
+        return sum(e["baris"] for e in self.manifest)
+
+    def _table(self, entry):
+        with self._lock:
+            table = self._tables.get(entry["file"])
+            if table is None:
+                _, feather = _pyarrow()
+                table = self._tables[entry["file"]] = feather.read_table(os.path.join(self.folder, entry["file"]), memory_map=True)
+            return table
+
+    def month(self, year, month):
+        key = f"{int(year):04d}-{int(month):02d}"
+        entry = self.closed_months().get(key)
+        if entry is None: return None
+        start, end = entry["bulan"][key]
+        return self._table(entry).slice(start, end - start).to_pandas()
+
+    def frame(self, columns=None):
+        if not self.manifest: return pd.DataFrame(columns=columns or WORKSHEET_HEADERS["transaksi"])
+        return pd.concat([(self._table(e).select(columns) if columns else self._table(e)).to_pandas() for e in self.manifest], ignore_index=True)
+
+    def buckets(self):
+        out = {}
+        for e in self.manifest:
+            for ym, per_tipe in e["bucket"].items():
+                y, m = map(int, ym.split("-"))
+                for tipe, total in per_tipe.items(): out[(y, m, tipe)] = out.get((y, m, tipe), 0) + total
+        return out
+
+    def freeze(self, periode, df, user):
+        # df: baris transaksi bertipe dalam periode, terurut menurut tanggal
+        pa, feather = _pyarrow()
+        bulan = periode_bulan(periode)
+        with self._lock:
+            closed = self.closed_months()
+            if any(b in closed for b in bulan): raise ValueError(f"Sebagian periode {periode} sudah ditutup")
+            df = df.reset_index(drop=True)
+            ym = df['tanggal'].dt.strftime('%Y-%m').tolist()
+            nominal = pd.to_numeric(df['nominal'], errors='coerce').fillna(0)
+            bucket = {}
+            for (b, tipe), total in nominal.groupby([pd.Series(ym, dtype=object), df['tipe'].astype(str)]).sum().items():
+                bucket.setdefault(b, {})[tipe] = int(total)
+            name = f"transaksi_{periode}.arrow"
+            path = os.path.join(self.folder, name)
+            os.makedirs(self.folder, exist_ok=True)
+            feather.write_feather(pa.Table.from_pandas(df, preserve_index=False), path + ".tmp", compression="zstd")
+            os.replace(path + ".tmp", path)
+            os.chmod(path, 0o444)
+            if feather.read_table(path, memory_map=True).num_rows != len(df): raise IOError(f"Snapshot {name} tidak lengkap")
+            with open(path, "rb") as f: digest = hashlib.sha256(f.read()).hexdigest()
+            entry = {"periode": periode, "file": name, "baris": len(df), "sha256": digest, "ditutup_oleh": user,
+                     "waktu": datetime.now().isoformat(timespec='seconds'),
+                     "bulan": {b: [bisect.bisect_left(ym, b), bisect.bisect_right(ym, b)] for b in bulan}, "bucket": bucket}
+            manifest = self.manifest + [entry]
+            with open(os.path.join(self.folder, "manifest.json.tmp"), "w") as f: json.dump(manifest, f, indent=1)
+            os.replace(os.path.join(self.folder, "manifest.json.tmp"), os.path.join(self.folder, "manifest.json"))
+            self.manifest = manifest
+            return entry
+
+@st.cache_resource
+def _arsip_lokal():
+    return Arsip(ARSIP_DIR, get_config("CACHE_TTL_DETIK", 60))
+
+def get_arsip():
+    return _arsip_lokal().ensure(get_data)
+
+def _arsip_checksum(df):
+    # Tidak bergantung urutan baris maupun bentuk angka (60000 / "60000"), jadi sama untuk Sheets dan SQLite
+    rows = df.reindex(columns=WORKSHEET_HEADERS["transaksi"]).values.tolist()
+    return hashlib.sha256("".join(sorted(map(_row_hash, rows))).encode()).hexdigest()
+
+def _simpan_arsip(periode, raw, user):
+    # Salinan tahan lama di worksheet arsip: tulis baris yang belum ada, baca ulang dan cocokkan, baru catat di manifest.
+    # Boleh diulang setelah gagal di tengah; dengan backend sync, antrean mengirim arsip sebelum hapusan baris live.
+    for ws in ("arsip_transaksi", "arsip_manifest"):
+        get_backend().ensure_table(ws)
+        get_sheet_cache().invalidate(ws)
+    if str(periode) in set(get_data("arsip_manifest").get('periode', pd.Series(dtype=str)).astype(str)): return
+    ada = get_data("arsip_transaksi")
+    ada = set(ada['id'].astype(str)) if 'id' in ada.columns else set()
+    baru = raw[~raw['id'].astype(str).isin(ada)].reindex(columns=WORKSHEET_HEADERS["transaksi"])
+    add_rows("arsip_transaksi", [["" if _is_blank(v) else v for v in r] + [periode] for r in baru.values.tolist()])
+    get_sheet_cache().invalidate("arsip_transaksi")
+    tersimpan = get_data("arsip_transaksi")
+    tersimpan = tersimpan[tersimpan['periode_arsip'].astype(str) == str(periode)] if 'periode_arsip' in tersimpan.columns else tersimpan.iloc[:0]
+    checksum = _arsip_checksum(raw)
+    if len(tersimpan) != len(raw) or _arsip_checksum(tersimpan) != checksum:
+        raise IOError(f"Salinan arsip periode {periode} di worksheet arsip_transaksi tidak cocok ({len(tersimpan)} dari {len(raw)} baris); data live tidak dihapus.")
+    add_row("arsip_manifest", [periode, len(raw), checksum, user, datetime.now().isoformat(timespec='seconds')])
+
+def tutup_buku(periode, user):
+    # Bekukan periode yang sudah lewat ke arsip, lalu hapus barisnya dari data live.
+    # Baris live baru dihapus setelah salinan di worksheet arsip terbukti lengkap; folder lokal hanya cache baca.
+    # Bila penghapusan sempat gagal, memanggil ulang dengan periode yang sama hanya membersihkan sisa baris live.
+    bulan = periode_bulan(periode)
+    start = pd.Timestamp(bulan[0] + "-01")
+    end = pd.Timestamp(bulan[-1] + "-01") + pd.offsets.MonthBegin(1)
+    if end > pd.Timestamp(date.today().replace(day=1)): raise ValueError("Hanya periode yang sudah lewat yang bisa ditutup")
+    for ws in ("transaksi", "arsip_manifest"): get_sheet_cache().invalidate(ws)
+    get_typed_tables().invalidate("transaksi")
+    arsip = _arsip_lokal().ensure(get_data, force=True)
+    live = load_typed("transaksi").between(start, end)
+    raw = get_data("transaksi")
+    raw = raw[raw['id'].astype(str).isin(set(live['id'].astype(str)))] if 'id' in raw.columns else raw
+    entry = next((e for e in arsip.manifest if e["periode"] == periode), None)
+    if entry is None:
+        if any(b in arsip.closed_months() for b in bulan): raise ValueError(f"Sebagian periode {periode} sudah ditutup")
+        # Arsip menyimpan nilai bertipe: teks yang gagal dibaca akan jadi kosong, padahal baris live-nya dihapus
+        _, rusak = apply_schema("transaksi", raw)
+        if rusak: raise ValueError(f"{len(rusak)} nilai di periode {periode} tidak bisa dibaca; perbaiki dulu sebelum tutup buku: " + "; ".join(rusak[:5]) + (" ..." if len(rusak) > 5 else ""))
+        _simpan_arsip(periode, raw, user)
+        entry = arsip.freeze(periode, live, user)
+    else:
+        snap = arsip._table(entry).to_pandas()
+        # Arsip lokal dari sebelum ada worksheet arsip: unggah dulu sebelum sisa baris live dihapus
+        teks = snap.assign(tanggal=snap['tanggal'].dt.strftime('%Y-%m-%d')).astype(object)
+        _simpan_arsip(periode, teks.where(teks.notna(), ''), entry["ditutup_oleh"])
+        live = live[live['id'].astype(str).isin(set(snap['id'].astype(str)))]
+    n = delete_rows_by_ids("transaksi", live['id'].astype(str).tolist()) if not live.empty else 0
+    get_summary_store().invalidate()
+    get_payment_matrix().invalidate()
+    return entry, n
+
+def transaksi_bulan(year, month):
+    # (df, dari_arsip): bulan yang sudah tutup buku dibaca dari snapshot, selain itu dari data live
+    df = get_arsip().month(year, month)
+    if df is not None: return df, True
+    return load_typed("transaksi").month(year, month), False
+
+# --- INDEKS TUNGGAKAN ---
+BULAN_SINGKAT = {"jan": 1, "feb": 2, "mar": 3, "apr": 4, "mei": 5, "may": 5, "jun": 6, "jul": 7, "agu": 8, "agt": 8, "aug": 8,
+                 "sep": 9, "okt": 10, "oct": 10, "nov": 11, "des": 12, "dec": 12}
+
+def parse_periode(text):
+    # "Jan 2026", "Januari 2026", "01/2026", "2026-01", "Jan-26" -> (2026, 1); None bila tidak dikenali
+    t = str(text).strip().lower()
+    m = re.fullmatch(r"(\d{4})\s*[-/.]\s*(\d{1,2})", t)
+    if m: y, mo = int(m[1]), int(m[2])
+    else:
+        m = re.fullmatch(r"(\d{1,2})\s*[-/.]\s*(\d{4})", t) or re.fullmatch(r"([a-z]+)\.?[\s\-/.,']*(\d{4}|\d{2})", t)
+        if not m: return None
+        mo = int(m[1]) if m[1].isdigit() else BULAN_SINGKAT.get(m[1][:3])
+        y = int(m[2]) + (2000 if len(m[2]) == 2 else 0)
+    if not mo or not 1 <= mo <= 12: return None
+    return y, mo
+
+def periode_key(text):
+    p = parse_periode(text)
+    return f"{p[0]:04d}-{p[1]:02d}" if p else ""
+
+def with_periode_key(row_data):
+    headers = WORKSHEET_HEADERS["tunggakan"]
+    row = list(row_data)[:headers.index('periode_key')]
+    row += [''] * (headers.index('periode_key') - len(row))
+    return row + [periode_key(row[headers.index('periode')])]
+
+class TunggakanIndex:
+    # Indeks tunggakan per periode (tahun, bulan) dan per warga, plus total belum lunas per warga
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._built_at = None
+        self.rows = []
+
+    def ensure(self, load):
+        with self._lock:
+            if self._built_at is None or time.monotonic() - self._built_at > self.ttl: self.rebuild(load("tunggakan"))
+            return self
+
+    def rebuild(self, df):
+        with self._lock:
+            self.rows, self.by_key, self.by_nama, self.by_periode, self.outstanding = [], {}, {}, {}, {}
+            if not df.empty: self._add(df)
+            self._built_at = time.monotonic()
+
+    def apply(self, added=None, removed=None, replaced=None):
+        with self._lock:
+            if self._built_at is None: return
+            if replaced is not None: self.rebuild(replaced)
+            elif removed is not None or added is None: self._built_at = None # susun ulang saat dibutuhkan
+            else: self._add(added)
+
+    def _add(self, df):
+        for rec in df.to_dict('records'):
+            pos = len(self.rows)
+            if _is_blank(rec.get('periode_key')): rec['periode_key'] = periode_key(rec.get('periode', ''))
+            rec['nominal'] = pd.to_numeric(rec.get('nominal'), errors='coerce')
+            if pd.isna(rec['nominal']): rec['nominal'] = 0
+            self.rows.append(rec)
+            nama = str(rec.get('nama_warga', ''))
+            self.by_key.setdefault(rec['periode_key'], []).append(pos)
+            self.by_nama.setdefault(nama.lower(), []).append(pos)
+            self.by_periode.setdefault(str(rec.get('periode', '')).lower(), []).append(pos)
+            if rec.get('status') == 'Belum Lunas': self.outstanding[nama] = self.outstanding.get(nama, 0) + rec['nominal']
+
+    def search(self, text):
+        # Periode yang dikenali -> lookup langsung; selain itu cocokkan ke nama/teks periode unik, bukan ke setiap baris
+        with self._lock:
+            text = str(text).strip()
+            if not text: positions = range(len(self.rows))
+            elif periode_key(text): positions = self.by_key.get(periode_key(text), [])
+            else:
+                t = text.lower()
+                positions = sorted({p for idx in (self.by_nama, self.by_periode) for k, ps in idx.items() if t in k for p in ps})
+            return pd.DataFrame([self.rows[p] for p in positions], columns=WORKSHEET_HEADERS["tunggakan"])
+
+    def aging(self, today):
+        # Umur tunggakan belum lunas per warga: 0-3, 3-6, >6 bulan dari periodenya
+        kolom = ["0-3 bulan", "3-6 bulan", "6+ bulan", "Periode tidak dikenal"]
+        umur = {}
+        with self._lock:
+            for rec in self.rows:
+                if rec.get('status') != 'Belum Lunas': continue
+                if rec['periode_key']:
+                    y, m = map(int, rec['periode_key'].split('-'))
+                    bulan = (today.year - y) * 12 + today.month - m
+                    k = kolom[0] if bulan <= 3 else kolom[1] if bulan <= 6 else kolom[2]
+                else: k = kolom[3]
+                per_warga = umur.setdefault(rec.get('nama_warga', ''), dict.fromkeys(kolom, 0))
+                per_warga[k] += rec['nominal']
+        df = pd.DataFrame.from_dict(umur, orient='index', columns=kolom)
+        df['Total'] = df.sum(axis=1)
+        return df.sort_values('Total', ascending=False)
+
+@st.cache_resource
+def get_tunggakan_index():
+    return TunggakanIndex(get_config("CACHE_TTL_DETIK", 60))
+
+# --- MATRIKS IURAN WARGA ---
+IURAN_KATEGORI = get_config("IURAN_KATEGORI", "Iuran Warga")
+WARGA_DEFAULT = [ # Isi awal tabel warga: (no, nama, iuran bulanan)
+    (1, "Indomaret", 460000),
+    (2, "Suparman", 160000),
+    (3, "Aji Pamungkas", 60000),
+    (4, "Andre Christianto", 100000),
+    (5, "Hj. Darwin", 60000),
+    (6, "Soedarnoto", 60000),
+    (7, "dr. Eko Andrianto", 100000),
+    (8, "Djoko S", 60000),
+    (9, "H. Suwindi I", 60000),
+    (10, "H. Suwindi II", 50000),
+    (11, "Yusuf", 60000),
+    (12, "Hj. Ngarjojo", 60000),
+    (13, "Safri", 60000),
+    (14, "H. Komarudin", 60000),
+    (15, "Hj. Yuyanti I", 60000),
+    (16, "Hj. Yuyanti II", 60000),
+    (17, "H. Nugroho S", 60000),
+    (18, "Amba Kosasih", 60000),
+    (19, "Wawan", 60000),
+    (20, "H. Hadi Djuweni", 60000),
+    (21, "Priyo Utomo", 60000),
+    (22, "Hamid", 60000),
+    (23, "H. Hadi Sulistyo", 95000),
+    (24, "Singgih Djarwanto", 60000),
+    (25, "Nurhaini Agus S", 60000),
+    (26, "Joko P", 60000),
+    (27, "Lulus A", 60000),
+    (28, "Liliek Djito", 60000),
+    (29, "Budi Santoso", 60000),
+    (30, "H. Slamet Kaslan", 60000),
+    (31, "Annie H", 60000),
+    (32, "Joni", 60000),
+    (33, "Dayatno", 60000),
+    (34, "Arif Munandar", 60000),
+    (35, "Sie Sien", 60000),
+    (36, "Taman RT / Lukman", 100000)
+]
+
+class PaymentMatrix:
+    # Pembayaran iuran per (warga, tahun, bulan) dari transaksi kategori IURAN_KATEGORI; warga dikenali dari namanya di keterangan
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._built_at = None
+        self.paid = {}
+        self.warga = pd.DataFrame(columns=WORKSHEET_HEADERS["warga"])
+
+    def ensure(self, load):
+        with self._lock:
+            if self._built_at is None or time.monotonic() - self._built_at > self.ttl: self.rebuild(load)
+            return self
+
+    def rebuild(self, load):
+        with self._lock:
+            warga = load("warga")
+            if not warga.empty:
+                warga = warga.assign(no=pd.to_numeric(warga['no'], errors='coerce'), nominal=pd.to_numeric(warga['nominal'], errors='coerce').fillna(0))
+                warga = warga.sort_values('no', kind='stable').reset_index(drop=True)
+            self.warga = warga
+            names = sorted(warga['nama'].astype(str), key=len, reverse=True) if not warga.empty else []
+            self._canon = {n.lower(): n for n in names}
+            self._pattern = r"(?<!\w)(" + "|".join(map(re.escape, names)) + r")(?!\w)" if names else None
+            self.paid = {}
+            self._add(load("transaksi"), 1)
+            if get_arsip().manifest: self._add(get_arsip().frame(['tanggal', 'tipe', 'kategori', 'nominal', 'keterangan']), 1)
+            self._built_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock: self._built_at = None
+
+    def apply(self, worksheet_name, added=None, removed=None, replaced=None):
+        with self._lock:
+            if self._built_at is None: return
+            if worksheet_name == "warga" or (added is None and removed is None and replaced is None):
+                self._built_at = None
+                return
+            if replaced is not None:
+                self.paid = {}
+                self._add(replaced, 1)
+            if added is not None: self._add(added, 1)
+            if removed is not None: self._add(removed, -1)
+
+    def _add(self, df, sign):
+        if df.empty or self._pattern is None: return
+        df = df[(df['kategori'] == IURAN_KATEGORI) & (df['tipe'] == 'Pemasukan')]
+        if df.empty: return
+        nama = df['keterangan'].astype(str).str.extract(self._pattern, flags=re.I, expand=False).str.lower().map(self._canon)
+        tgl = pd.to_datetime(df['tanggal'], errors='coerce', format='mixed')
+        nominal = pd.to_numeric(df['nominal'], errors='coerce').fillna(0)
+        ok = nama.notna() & tgl.notna()
+        grouped = nominal[ok].groupby([nama[ok], tgl[ok].dt.year, tgl[ok].dt.month]).sum()
+        for k, v in grouped.items(): self.paid[k] = self.paid.get(k, 0) + sign * v
+
+    def matrix(self, year):
+        with self._lock:
+            names = self.warga['nama'].tolist() if not self.warga.empty else []
+            data = [[self.paid.get((n, year, m), 0) for m in range(1, 13)] for n in names]
+        return pd.DataFrame(data, index=names, columns=[b[:3] for b in get_month_map()])
+
+    def roster(self, year, month):
+        # (sudah bayar, belum bayar) dalam format data kwitansi: dict no/nama/nominal
+        with self._lock:
+            bayar, belum = [], []
+            for rec in self.warga.to_dict('records'):
+                total = self.paid.get((rec['nama'], year, month), 0)
+                no = int(rec['no']) if not pd.isna(rec['no']) else len(bayar) + len(belum) + 1
+                if total > 0: bayar.append({"no": no, "nama": rec['nama'], "nominal": int(total)})
+                else: belum.append({"no": no, "nama": rec['nama'], "nominal": int(rec['nominal'])})
+            return bayar, belum
+
+@st.cache_resource
+def get_payment_matrix():
+    return PaymentMatrix(get_config("RINGKASAN_MAKS_UMUR_DETIK", 600))
+
+def buka_tunggakan(belum, bulan, tahun):
+    # Satu penulisan batch untuk semua warga yang belum bayar; periode yang sudah tercatat tidak dibuat ulang
+    idx = get_tunggakan_index().ensure(get_data)
+    key = f"{tahun:04d}-{get_month_map()[bulan]:02d}"
+    sudah = {str(idx.rows[p].get('nama_warga', '')).lower() for p in idx.by_key.get(key, [])}
+    rows = [[str(uuid.uuid4())[:8], w['nama'], f"{bulan} {tahun}", w['nominal'], 'Belum Lunas'] for w in belum if w['nama'].lower() not in sudah]
+    add_rows("tunggakan", rows)
+    return len(rows)
+
+# --- IMPORT MASSAL ---
+IMPORT_CHUNK_BARIS = get_config("IMPORT_CHUNK_BARIS", 500)
+IMPORT_KOLOM = {
+    "transaksi": ['tanggal', 'tipe', 'kategori', 'nominal', 'keterangan'],
+    "arisan_bayar": ['nama_warga', 'periode', 'nominal', 'tanggal_bayar'],
+}
+
+def read_import_chunks(uploaded, filename, chunk_size=None):
+    # Baca CSV/XLSX per potongan agar file besar tidak dimuat sekaligus; semua nilai dibaca sebagai teks
+    chunk_size = chunk_size or IMPORT_CHUNK_BARIS
+    if filename.lower().endswith(".csv"):
+        for chunk in pd.read_csv(uploaded, dtype=str, keep_default_na=False, chunksize=chunk_size, skipinitialspace=True):
+            yield chunk.rename(columns=lambda c: str(c).strip().lower())
+        return
+    try:
+        import openpyxl
+    except ImportError:
+        raise ImportError("Import XLSX membutuhkan paket openpyxl (pip install openpyxl); gunakan CSV sebagai gantinya.")
+    wb = openpyxl.load_workbook(uploaded, read_only=True, data_only=True)
+    try:
+        rows = wb.active.iter_rows(values_only=True)
+        header = [str(c).strip().lower() if c is not None else '' for c in next(rows, [])]
+        buf = []
+        for r in rows:
+            if all(v is None for v in r): continue
+            buf.append(['' if v is None else (v.date().isoformat() if isinstance(v, datetime) else str(v)) for v in r])
+            if len(buf) >= chunk_size:
+                yield pd.DataFrame(buf, columns=header)
+                buf = []
+        if buf: yield pd.DataFrame(buf, columns=header)
+    finally:
+        wb.close()
+
+def import_reference(worksheet_name):
+    # Daftar acuan validasi: pasangan (jenis, kategori) untuk transaksi, nama peserta untuk arisan_bayar
+    if worksheet_name == "transaksi":
+        df = get_data("kategori")
+        return set(zip(df['jenis'], df['nama'])) if not df.empty else set()
     df = get_data("arisan_peserta")
-    if df.empty: return "Belum ada peserta", None
-    
-    kandidat = df[df['status_menang'] == 'Belum']
-    reset_msg = ""
-    
-    if kandidat.empty:
-        df['status_menang'] = 'Belum'
-        save_all_data("arisan_peserta", df)
-        kandidat = df 
-        reset_msg = " (Putaran Baru!)"
-    
-    pemenang = kandidat.sample(1).iloc[0]
-    idx = df[df['id'] == pemenang['id']].index[0]
-    df.at[idx, 'status_menang'] = 'Sudah'
-    save_all_data("arisan_peserta", df)
-    
-    return f"🎉 {pemenang['nama_warga']} {reset_msg}", pemenang['nama_warga']
+    return set(df['nama_warga'].astype(str).str.strip()) if not df.empty else set()
+
+def validate_import_chunk(worksheet_name, chunk, start, reference, user):
+    # Hasil: (baris siap tulis sesuai WORKSHEET_HEADERS, error per baris); nomor baris mengikuti file (header = baris 1)
+    missing = [c for c in IMPORT_KOLOM[worksheet_name] if c not in chunk.columns]
+    if missing: return [], [f"kolom wajib tidak ada: {', '.join(missing)}"]
+    df = chunk.reindex(columns=IMPORT_KOLOM[worksheet_name]).fillna('').astype(str).apply(lambda c: c.str.strip())
+    df.index = range(start, start + len(df))
+    if worksheet_name == "arisan_bayar": df['status_bayar'] = 'Lunas'
+    typed, parse_errors = apply_schema(worksheet_name, df.reset_index(drop=True))
+    errors = {}
+    for e in parse_errors:
+        pos, pesan = e.split(": ", 1)
+        errors.setdefault(start + int(pos.split()[1]) - 2, []).append(pesan)
+    date_col = DATE_COLUMNS[worksheet_name]
+    checks = [((df[date_col] == '').to_numpy(), f"{date_col} kosong"), ((df['nominal'] == '').to_numpy(), "nominal kosong"),
+              ((typed['nominal'].fillna(1) <= 0).to_numpy(), "nominal harus lebih dari 0")]
+    if worksheet_name == "transaksi":
+        closed = get_arsip().closed_months()
+        checks.append((typed['tanggal'].dt.strftime('%Y-%m').isin(list(closed)).to_numpy(), "bulan ini sudah tutup buku"))
+        checks.append(([(t, k) not in reference for t, k in zip(df['tipe'], df['kategori'])], "kategori tidak terdaftar untuk tipe ini"))
+    else:
+        checks.append(((~df['nama_warga'].isin(reference)).to_numpy(), "nama bukan peserta arisan"))
+    for mask, pesan in checks:
+        for i in df.index[list(mask)]: errors.setdefault(int(i), []).append(pesan)
+    rows = []
+    for i, r, t in zip(df.index, df.to_dict('records'), typed.itertuples(index=False)):
+        if i in errors: continue
+        tgl = getattr(t, date_col).date().isoformat()
+        if worksheet_name == "transaksi":
+            rows.append([str(uuid.uuid4())[:8], tgl, r['tipe'], r['kategori'], int(t.nominal), r['keterangan'], user, "-"])
+        else:
+            rows.append([str(uuid.uuid4())[:8], r['nama_warga'], r['periode'], int(t.nominal), 'Lunas', tgl])
+    return rows, [f"baris {i}: {'; '.join(p)}" for i, p in sorted(errors.items())]
+
+def import_massal(worksheet_name, chunks, user, commit=False):
+    # Validasi semua potongan; bila commit, Sheets menulis satu append_rows per potongan,
+    # backend lokal menulis semua baris valid dalam satu transaksi
+    reference = import_reference(worksheet_name)
+    sheets = get_backend().name == "sheets"
+    hasil = {"valid": 0, "ditulis": 0, "errors": [], "pemasukan": 0, "pengeluaran": 0, "total": 0}
+    pending, start = [], 2
+    for chunk in chunks:
+        rows, errors = validate_import_chunk(worksheet_name, chunk, start, reference, user)
+        start += len(chunk)
+        hasil["errors"] += errors
+        hasil["valid"] += len(rows)
+        for r in rows:
+            if worksheet_name == "transaksi": hasil["pemasukan" if r[2] == "Pemasukan" else "pengeluaran"] += r[4]
+            else: hasil["total"] += r[3]
+        if not commit: continue
+        if sheets:
+            add_rows(worksheet_name, rows)
+            hasil["ditulis"] += len(rows)
+        else: pending += rows
+    if pending:
+        add_rows(worksheet_name, pending)
+        hasil["ditulis"] += len(pending)
+    return hasil
+
+# --- LOGIKA ARISAN ---
+class DrawEngine:
+    # Kocokan arisan: sisa kandidat & nomor putaran disimpan sebagai state, satu kocokan = satu sel status + satu baris log.
+    # Kocokan diserialkan dengan lock dan compare-and-swap pada nomor putaran.
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._own_write = False
+        self._state = None
+        self._built_at = 0.0
+
+    def invalidate(self):
+        with self._lock:
+            if not self._own_write: self._state = None
+
+    def _reload(self):
+        # Status peserta bisa diubah langsung di Sheet: kocokan selalu memakai data yang baru dibaca
+        ctx = current_rerun()
+        for ws in ("arisan_peserta", "arisan_log"):
+            get_sheet_cache().invalidate(ws)
+            if ctx: ctx.invalidate(ws)
+        self._state = None
+        return self.state()
+
+    def state(self):
+        with self._lock:
+            if self._state is None or time.monotonic() - self._built_at > self.ttl:
+                peserta = get_data("arisan_peserta")
+                log = get_data("arisan_log")
+                putaran = int(pd.to_numeric(log['putaran'], errors='coerce').max()) if 'putaran' in log.columns and not log.empty else 1
+                ids = peserta['id'].astype(str).tolist() if 'id' in peserta.columns else []
+                sisa = set(peserta.loc[peserta['status_menang'] == 'Belum', 'id'].astype(str)) if ids else set()
+                self._state = {"putaran": putaran, "peserta": dict(zip(ids, peserta['nama_warga'])) if ids else {}, "sisa": sisa}
+                self._built_at = time.monotonic()
+            return self._state
+
+    def draw(self, expected_round=None, admin=""):
+        with self._lock:
+            st_ = self._reload()
+            if not st_["peserta"]: return "Belum ada peserta", None
+            if expected_round is not None and expected_round != st_["putaran"]:
+                return f"Putaran sudah berganti ke-{st_['putaran']} oleh admin lain, silakan kocok ulang.", None
+            putaran_baru = not st_["sisa"]
+            putaran = st_["putaran"] + 1 if putaran_baru else st_["putaran"]
+            kandidat = sorted(st_["peserta"]) if putaran_baru else sorted(st_["sisa"])
+            seed = random.SystemRandom().getrandbits(64)
+            pemenang = replay_draw(seed, kandidat)
+            # Log harus bisa ditulis sebelum status pemenang diubah, agar tidak ada pemenang tanpa baris log
+            get_backend().ensure_table("arisan_log")
+            self._own_write = True
+            try:
+                if putaran_baru:
+                    # Reset status dan tandai pemenang dalam satu penulisan delta
+                    df = get_data("arisan_peserta")
+                    df['status_menang'] = (df['id'].astype(str) == pemenang).map({True: 'Sudah', False: 'Belum'})
+                    save_all_data("arisan_peserta", df)
+                else:
+                    update_fields("arisan_peserta", pemenang, {"status_menang": "Sudah"})
+                add_row("arisan_log", [str(uuid.uuid4())[:8], datetime.now().isoformat(timespec='seconds'), putaran, str(seed), pemenang,
+                                       st_["peserta"][pemenang], ",".join(kandidat), admin])
+            except Exception:
+                self._state = None
+                raise
+            finally:
+                self._own_write = False
+            st_["putaran"] = putaran
+            st_["sisa"] = set(kandidat) - {pemenang}
+            nama = st_["peserta"][pemenang]
+            return f"🎉 {nama} {' (Putaran Baru!)' if putaran_baru else ''}", nama
+
+def replay_draw(seed, kandidat):
+    # Dapat diulang siapa saja dari log: seed yang sama + kandidat terurut yang sama = pemenang yang sama
+    return random.Random(int(seed)).choice(sorted(kandidat))
+
+@st.cache_resource
+def get_draw_engine():
+    return DrawEngine(get_config("CACHE_TTL_DETIK", 60))
+
+def kocok_pemenang(expected_round=None, admin=""):
+    return get_draw_engine().draw(expected_round, admin)
 
 # --- PDF GENERATOR (LAPORAN BIASA) ---
 class PDF(FPDF):
@@ -87,7 +1898,35 @@ class PDF(FPDF):
         self.set_font('Arial', 'I', 8)
         self.cell(0, 10, f'Halaman {self.page_no()}', 0, 0, 'C')
 
-def create_pdf_universal(dataframe, judul, headers, cols, widths):
+def _format_table(dataframe, cols):
+    # Format seluruh kolom sekaligus; hasil: teks per kolom, nilai bertanda per baris (untuk total), dan ada/tidaknya nominal
+    sign = (dataframe['tipe'] == 'Pemasukan') * 2 - 1 if 'tipe' in dataframe.columns else 1
+    signed = pd.Series(0.0, index=dataframe.index)
+    texts, has_nominal = [], False
+    for c in cols:
+        col = dataframe[c]
+        s = col.dt.strftime('%Y-%m-%d') if pd.api.types.is_datetime64_any_dtype(col) else col.astype(str)
+        s = s.where(col.notna(), '')
+        if 'nominal' in c:
+            mask = s.str.replace('.', '', n=1, regex=False).str.isdigit()
+            num = pd.to_numeric(s.where(mask), errors='coerce')
+            s = s.where(~mask, num.map('{:,.0f}'.format))
+            signed = signed + (num * sign).fillna(0)
+            has_nominal = has_nominal or bool(mask.any())
+        texts.append(s.tolist())
+    return texts, signed.tolist(), has_nominal
+
+def write_pdf(pdf, out, chunk_size=1 << 16):
+    # Tulis dokumen ke file-like per potongan, tanpa membuat salinan bytes utuh dari seluruh dokumen
+    if pdf.state < 3: pdf.close()
+    pdf.pages = {} # isi halaman sudah tersalin ke buffer
+    buf = pdf.buffer
+    for i in range(0, len(buf), chunk_size): out.write(buf[i:i + chunk_size].encode('latin-1'))
+    return out
+
+@timed("pdf.laporan")
+def create_pdf_universal(dataframe, judul, headers, cols, widths, subtotal_per_halaman=False, out=None, progress=None):
+    texts, signed, has_nominal = _format_table(dataframe, cols)
     pdf = PDF()
     pdf.add_page()
     pdf.set_font("Arial", 'B', 12)
@@ -95,42 +1934,60 @@ def create_pdf_universal(dataframe, judul, headers, cols, widths):
     pdf.ln(5)
     pdf.set_font("Arial", size=10)
     
-    for i, h in enumerate(headers): pdf.cell(widths[i], 10, h, 1, 0, 'C')
-    pdf.ln()
-    
-    total = 0
-    has_nominal = False
-    
-    for _, row in dataframe.iterrows():
-        for i, c in enumerate(cols):
-            val = str(row[c])
-            if 'nominal' in c and val.replace('.','',1).isdigit(): 
-                val_float = float(val)
-                val = f"{val_float:,.0f}"
-                has_nominal = True
-                if 'tipe' in dataframe.columns:
-                    if row['tipe'] == 'Pemasukan': total += val_float
-                    else: total -= val_float
-                else: total += val_float
-            pdf.cell(widths[i], 8, val, 1)
+    def draw_header():
+        for w, h in zip(widths, headers): pdf.cell(w, 10, h, 1, 0, 'C')
+        pdf.ln()
+
+    def draw_subtotal(value):
+        pdf.set_font("Arial", 'I', 9)
+        pdf.cell(sum(widths), 8, f"Subtotal halaman: Rp {value:,.0f}", 1, 1, 'R')
+        pdf.set_font("Arial", size=10)
+
+    draw_header()
+    row_h = 8
+    limit = pdf.page_break_trigger - (row_h if subtotal_per_halaman and has_nominal else 0)
+    page_total = 0.0
+    # Pindah halaman sendiri (bukan auto page break) agar header tabel & subtotal ikut di setiap halaman
+    for i, (row, value) in enumerate(zip(zip(*texts), signed)):
+        if progress and i % 500 == 0: progress(i / len(signed))
+        if pdf.get_y() + row_h > limit:
+            if subtotal_per_halaman and has_nominal: draw_subtotal(page_total)
+            pdf.add_page()
+            draw_header()
+            page_total = 0.0
+        for w, val in zip(widths, row): pdf.cell(w, row_h, val, 1)
         pdf.ln()
+        page_total += value
+    if subtotal_per_halaman and has_nominal and pdf.page > 1: draw_subtotal(page_total)
     
     if has_nominal:
         pdf.ln(5)
         pdf.set_font("Arial", 'B', 10)
         label_total = "Sisa Saldo" if 'tipe' in dataframe.columns else "Total"
-        pdf.cell(0, 8, f"{label_total}: Rp {total:,.0f}", 0, 1)
-    return pdf.output(dest='S').encode('latin-1')
+        pdf.cell(0, 8, f"{label_total}: Rp {sum(signed):,.0f}", 0, 1)
+    if out is not None: return write_pdf(pdf, out)
+    return write_pdf(pdf, io.BytesIO()).getvalue()
 
 # --- PDF GENERATOR (KHUSUS KWITANSI) ---
+KWITANSI_PER_HALAMAN = 4 # DIUBAH DARI 5 MENJADI 4 AGAR TIDAK TERPOTONG
+KWITANSI_MARGIN_TOP = 10
+KWITANSI_TINGGI = 55
+KWITANSI_JARAK = 5
+
 class KwitansiPDF(FPDF):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_auto_page_break(auto=False, margin=0)
+        # Urutan font tetap (F1=Arial, F2=Arial B, F3=Arial I) agar isi halaman/template bisa dipakai lintas dokumen
+        for style in ("", "B", "I"): self.set_font("Arial", style, 10)
+
     def header(self):
         pass # Tidak ada header global
     def footer(self):
         pass # Tidak ada footer global
-    
-    def buat_kwitansi(self, data, bulan, tahun, y_position):
-        self.set_xy(10, y_position)
+
+    def buat_template(self, y_position):
+        # Bagian statis kwitansi: bingkai, alamat RT, label, kotak, dan TTD bendahara
         self.rect(10, y_position, 195, 55) # Border Luar
         self.line(40, y_position, 40, y_position + 55) # Garis Vertikal
         
@@ -152,108 +2009,400 @@ class KwitansiPDF(FPDF):
         for i in range(5):
             self.rect(box_x + (i*6), y_position + 4, 6, 6)
 
+        # Label baris 2-4
+        for offset, label in ((14, "Telah terima dari"), (22, "Uang sejumlah"), (30, "Untuk membayar"), (42, "Terbilang")):
+            self.set_xy(start_x, y_position + offset)
+            self.cell(35, 6, label, 0, 0)
+            self.cell(5, 6, ":", 0, 0)
+        self.rect(start_x + 40, y_position + 22, 110, 6) # Kotak Terbilang
+        self.rect(start_x + 40, y_position + 41, 45, 8) # Kotak Angka
+
+        # TTD
+        self.set_font("Arial", "", 9)
+        self.set_xy(start_x + 100, y_position + 40)
+        self.cell(50, 4, "Bendahara RT. 06 RW.X Pondok Beringin Semarang", 0, 1, 'C')
+        self.set_font("Arial", "B", 10)
+        self.set_xy(start_x + 100, y_position + 49)
+        self.cell(50, 5, "AJI PAMUNGKAS", 0, 0, 'C')
+
+    def buat_kwitansi(self, data, bulan, tahun, y_position):
+        # Tempel template statis (digeser ke y_position) lalu isi kolom milik warga ini saja
+        self._out(f"q 1 0 0 1 0 {-y_position * self.k:.2f} cm\n{kwitansi_template()}Q")
+        start_x = 42
+
         # Baris 2: Telah terima dari
-        self.set_xy(start_x, y_position + 14)
-        self.cell(35, 6, "Telah terima dari", 0, 0)
-        self.cell(5, 6, ":", 0, 0)
         self.set_font("Arial", "B", 10)
+        self.set_xy(start_x + 40, y_position + 14)
         self.cell(100, 6, data['nama'], 0, 1)
 
         # Baris 3: Uang Sejumlah
-        self.set_font("Arial", "", 10)
-        self.set_xy(start_x, y_position + 22)
-        self.cell(35, 6, "Uang sejumlah", 0, 0)
-        self.cell(5, 6, ":", 0, 0)
-        self.rect(start_x + 40, y_position + 22, 110, 6) # Kotak Terbilang
         kalimat_terbilang = terbilang(data['nominal']) + " Rupiah"
         self.set_xy(start_x + 42, y_position + 22)
         self.set_font("Arial", "I", 10)
         self.cell(105, 6, kalimat_terbilang, 0, 0)
 
         # Baris 4: Untuk membayar
-        self.set_font("Arial", "", 10)
-        self.set_xy(start_x, y_position + 30)
-        self.cell(35, 6, "Untuk membayar", 0, 0)
-        self.cell(5, 6, ":", 0, 0)
         self.set_font("Arial", "B", 10)
+        self.set_xy(start_x + 40, y_position + 30)
         self.cell(100, 6, f"Iuran RT / RW   Bulan : {bulan} {tahun}", 0, 0)
 
-        # Footer: Angka & TTD
+        # Footer: Angka & Tanggal
         self.set_xy(start_x + 40, y_position + 42)
-        self.rect(start_x + 40, y_position + 41, 45, 8)
         self.set_font("Arial", "B", 12)
         formatted_money = "Rp. {:,.0f},-".format(data['nominal']).replace(",", ".")
         self.cell(45, 6, formatted_money, 0, 0, 'L')
-        
-        self.set_font("Arial", "", 10)
-        self.set_xy(start_x, y_position + 42)
-        self.cell(35, 6, "Terbilang", 0, 0)
-        self.cell(5, 6, ":", 0, 0)
 
         self.set_font("Arial", "", 9)
         self.set_xy(start_x + 100, y_position + 36)
         self.cell(50, 5, f"Semarang, 01 {bulan} {tahun}", 0, 1, 'C')
-        self.set_xy(start_x + 100, y_position + 40)
-        self.cell(50, 4, "Bendahara RT. 06 RW.X Pondok Beringin Semarang", 0, 1, 'C')
-        self.set_font("Arial", "B", 10)
-        self.set_xy(start_x + 100, y_position + 49)
-        self.cell(50, 5, "AJI PAMUNGKAS", 0, 0, 'C')
+
+@st.cache_resource
+def kwitansi_template():
+    # Rekam operator PDF bagian statis sekali (pada y=0) untuk dipakai ulang di setiap kwitansi
+    pdf = KwitansiPDF(orientation='P', unit='mm', format='A4')
+    pdf.add_page()
+    start = len(pdf.pages[pdf.page])
+    pdf.font_family = '' # paksa setiap set_font di template menulis operator Tf-nya sendiri
+    pdf.buat_template(0)
+    return pdf.pages[pdf.page][start:]
+
+@timed("pdf.kwitansi")
+def render_kwitansi(data_warga, bulan, tahun, progress=None):
+    halaman = [data_warga[i:i + KWITANSI_PER_HALAMAN] for i in range(0, len(data_warga), KWITANSI_PER_HALAMAN)]
+    pdf = KwitansiPDF(orientation='P', unit='mm', format='A4')
+    for n, warga_halaman in enumerate(halaman):
+        if progress: progress(n / len(halaman))
+        pdf.add_page()
+        for i, warga in enumerate(warga_halaman):
+            pdf.buat_kwitansi(warga, bulan, tahun, KWITANSI_MARGIN_TOP + i * (KWITANSI_TINGGI + KWITANSI_JARAK))
+    if not halaman: pdf.add_page()
+    return write_pdf(pdf, io.BytesIO()).getvalue()
+
+# --- ANTREAN LAPORAN ---
+LAPORAN_CACHE_DIR = get_config("LAPORAN_CACHE_DIR", ".cache_laporan")
+
+def report_key(kind, periode, data):
+    # (jenis, periode, versi data): versi = hash isi data masukan, jadi edit dari mana pun menghasilkan kunci baru
+    if isinstance(data, pd.DataFrame): digest = pd.util.hash_pandas_object(data, index=False).values.tobytes()
+    else: digest = json.dumps(data, sort_keys=True, default=str).encode()
+    return f"{kind}_{periode}_{hashlib.sha1(digest).hexdigest()[:16]}".replace("/", "-").replace(" ", "_")
+
+class ReportCache:
+    # PDF selesai disimpan di disk dan dipakai bersama semua sesi; dibuang LRU (menurut mtime) bila melebihi batas
+    def __init__(self, folder, max_bytes):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.folder, key + ".pdf")
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as f: data = f.read()
+        except FileNotFoundError: return None
+        os.utime(self._path(key))
+        return data
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def discard(self, key):
+        try: os.remove(self._path(key))
+        except FileNotFoundError: pass
+
+    def put(self, key, data):
+        with self._lock:
+            os.makedirs(self.folder, exist_ok=True)
+            with open(self._path(key) + ".tmp", "wb") as f: f.write(data)
+            os.replace(self._path(key) + ".tmp", self._path(key))
+            files = sorted((e for e in os.scandir(self.folder) if e.name.endswith(".pdf")), key=lambda e: e.stat().st_mtime)
+            total = sum(e.stat().st_size for e in files)
+            for e in files[:-1]:
+                if total <= self.max_bytes: break
+                total -= e.stat().st_size
+                os.remove(e.path)
+
+class ReportJob:
+    def __init__(self, key, label):
+        self.key, self.label = key, label
+        self.state = "antre" # antre -> jalan -> selesai / gagal
+        self.progress = 0.0
+        self.error = ""
+        self.created = time.monotonic()
+        self.done = threading.Event() # diset saat selesai / gagal
+
+class ReportQueue:
+    # Render PDF di thread pool; permintaan dengan kunci sama selama masih antre/jalan digabung ke job yang sama
+    def __init__(self, cache, workers):
+        self.cache = cache
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="laporan")
+        self._lock = threading.Lock()
+        self.jobs = OrderedDict()
+
+    def _done(self, key, label):
+        job = ReportJob(key, label)
+        job.state, job.progress = "selesai", 1.0
+        job.done.set()
+        return job
+
+    def lookup(self, key):
+        # Job yang selesai hanya berlaku selama PDF-nya masih ada di disk (bisa terbuang oleh LRU)
+        with self._lock: job = self.jobs.get(key)
+        if job and job.state in ("antre", "jalan", "gagal"): return job
+        return self._done(key, job.label if job else key) if key in self.cache else None
+
+    def submit(self, key, label, render):
+        # render(progress) -> bytes
+        with self._lock:
+            job = self.jobs.get(key)
+            if job and job.state in ("antre", "jalan"): return job
+            if key in self.cache: return self._done(key, label)
+            job = self.jobs[key] = ReportJob(key, label)
+            while len(self.jobs) > 200: self.jobs.popitem(last=False)
+        self._pool.submit(self._run, job, render)
+        return job
+
+    def _run(self, job, render):
+        job.state = "jalan"
+        try:
+            self.cache.put(job.key, render(lambda p: setattr(job, "progress", min(max(p, 0.0), 0.99))))
+            job.state, job.progress = "selesai", 1.0
+        except Exception as e:
+            job.state, job.error = "gagal", str(e)
+        finally:
+            job.done.set()
+
+    def result(self, key):
+        return self.cache.get(key)
+
+@st.cache_resource
+def get_report_queue():
+    return ReportQueue(ReportCache(LAPORAN_CACHE_DIR, get_config("LAPORAN_CACHE_MAKS_MB", 200) * 1024 * 1024), get_config("LAPORAN_WORKER", 2))
+
+# --- AUTENTIKASI ---
+PBKDF2_ITERASI = get_config("PBKDF2_ITERASI", 310000)
+LOGIN_MAKS_GAGAL = get_config("LOGIN_MAKS_GAGAL", 5)
+LOGIN_KUNCI_DETIK = get_config("LOGIN_KUNCI_DETIK", 300)
+
+def hash_pass(p, salt=None, iterations=None):
+    # Format: pbkdf2_sha256$iterasi$salt_hex$hash_hex
+    iterations = iterations or PBKDF2_ITERASI
+    salt = salt or os.urandom(16)
+    digest = hashlib.pbkdf2_hmac('sha256', p.encode(), salt, iterations)
+    return f"pbkdf2_sha256${iterations}${salt.hex()}${digest.hex()}"
+
+def verify_pass(p, stored):
+    # (cocok, perlu_upgrade); hash SHA-256 lama tanpa salt tetap diterima lalu di-upgrade saat login
+    stored = str(stored)
+    if stored.startswith("pbkdf2_sha256$"):
+        try:
+            _, iterations, salt, _ = stored.split("$")
+            ok = hmac.compare_digest(hash_pass(p, bytes.fromhex(salt), int(iterations)), stored)
+        except ValueError: return False, False
+        return ok, ok and int(iterations) < PBKDF2_ITERASI
+    ok = hmac.compare_digest(hashlib.sha256(p.encode()).hexdigest(), stored)
+    return ok, ok
+
+class UserDirectory:
+    # username -> record dari worksheet users, plus penghitung gagal login per username (hanya di memori)
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._built_at = None
+        self.users = {}
+        self._gagal = {} # username -> (jumlah gagal, terkunci sampai)
+
+    def invalidate(self):
+        with self._lock: self._built_at = None
+
+    def ensure(self, load):
+        with self._lock:
+            if self._built_at is None or time.monotonic() - self._built_at > self.ttl:
+                df = load("users")
+                self.users = {str(r['username']): r for r in df.to_dict('records')} if not df.empty else {}
+                self._built_at = time.monotonic()
+            return self
+
+    def locked_for(self, username):
+        with self._lock:
+            _, sampai = self._gagal.get(username, (0, 0))
+            return max(0, sampai - time.monotonic())
+
+    def record(self, username, ok):
+        with self._lock:
+            if ok: self._gagal.pop(username, None); return
+            jumlah = self._gagal.get(username, (0, 0))[0] + 1
+            self._gagal[username] = (0, time.monotonic() + LOGIN_KUNCI_DETIK) if jumlah >= LOGIN_MAKS_GAGAL else (jumlah, 0)
+
+@st.cache_resource
+def _dummy_hash():
+    # Hash pengganti untuk username yang tidak ada; PBKDF2 mahal, jadi dihitung sekali per proses
+    return hash_pass("", b"\0" * 16)
+
+@st.cache_resource
+def get_user_directory():
+    return UserDirectory(get_config("CACHE_TTL_DETIK", 60) * 10)
+
+def authenticate(username, password):
+    # (record, pesan); username tak dikenal tetap menjalankan KDF agar waktu respons tidak membocorkan keberadaan user
+    directory = get_user_directory().ensure(get_data)
+    sisa = directory.locked_for(username)
+    if sisa: return None, f"Terlalu banyak percobaan gagal, coba lagi dalam {int(sisa // 60) + 1} menit."
+    rec = directory.users.get(username)
+    ok, upgrade = verify_pass(password, rec['password'] if rec else _dummy_hash())
+    ok = ok and rec is not None
+    directory.record(username, ok)
+    if not ok: return None, "Username atau password salah."
+    if upgrade: update_fields("users", username, {"password": hash_pass(password)})
+    return rec, ""
 
 # --- HELPERS ---
-def hash_pass(p): return hashlib.sha256(p.encode()).hexdigest()
 
 def get_month_map():
     return {"Januari": 1, "Februari": 2, "Maret": 3, "April": 4, "Mei": 5, "Juni": 6, "Juli": 7, "Agustus": 8, "September": 9, "Oktober": 10, "November": 11, "Desember": 12}
 
-def filter_by_date(df, col_name, month_name, year):
-    if df.empty: return df
-    try:
-        df[col_name] = pd.to_datetime(df[col_name])
-        month_idx = get_month_map()[month_name]
-        return df[(df[col_name].dt.month == month_idx) & (df[col_name].dt.year == year)]
-    except: return df
-
-def terbilang(n):
-    angka = ["", "Satu", "Dua", "Tiga", "Empat", "Lima", "Enam", "Tujuh", "Delapan", "Sembilan", "Sepuluh", "Sebelas"]
-    hasil = ""
+ANGKA = ["", "Satu", "Dua", "Tiga", "Empat", "Lima", "Enam", "Tujuh", "Delapan", "Sembilan", "Sepuluh", "Sebelas"]
+SKALA = [(10**12, "Triliun"), (10**9, "Miliar"), (10**6, "Juta"), (10**3, "Ribu")]
+
+def _terbilang_ratusan(n):
+    # 0..999 -> daftar kata
+    kata = []
+    ratus, sisa = divmod(n, 100)
+    if ratus == 1: kata.append("Seratus")
+    elif ratus: kata += [ANGKA[ratus], "Ratus"]
+    if sisa < 12:
+        if sisa: kata.append(ANGKA[sisa])
+    elif sisa < 20: kata += [ANGKA[sisa - 10], "Belas"]
+    else:
+        puluh, satuan = divmod(sisa, 10)
+        kata += [ANGKA[puluh], "Puluh"]
+        if satuan: kata.append(ANGKA[satuan])
+    return kata
+
+def eja_terbilang(n):
+    # Iteratif per kelompok tiga digit, hanya aritmetika integer; mendukung sampai ratusan triliun
     n = int(n)
-    if n >= 0 and n <= 11:
-        hasil = angka[n]
-    elif n < 20:
-        hasil = terbilang(n - 10) + " Belas"
-    elif n < 100:
-        hasil = terbilang(n / 10) + " Puluh " + terbilang(n % 10)
-    elif n < 200:
-        hasil = "Seratus " + terbilang(n - 100)
-    elif n < 1000:
-        hasil = terbilang(n / 100) + " Ratus " + terbilang(n % 100)
-    elif n < 2000:
-        hasil = "Seribu " + terbilang(n - 1000)
-    elif n < 1000000:
-        hasil = terbilang(n / 1000) + " Ribu " + terbilang(n % 1000)
-    return hasil.strip()
+    if n == 0: return "Nol"
+    if n < 0: return "Minus " + eja_terbilang(-n)
+    if n >= 10**15: raise ValueError(f"Nominal terlalu besar untuk terbilang: {n}")
+    kata = []
+    for nilai, nama in SKALA:
+        kelompok, n = divmod(n, nilai)
+        if kelompok == 1 and nilai == 1000: kata.append("Seribu")
+        elif kelompok: kata += _terbilang_ratusan(kelompok) + [nama]
+    return " ".join(kata + _terbilang_ratusan(n))
+
+@st.cache_resource
+def _terbilang_cache():
+    # Satu cache untuk seluruh proses; lru_cache di level modul akan dibuat ulang setiap rerun
+    return lru_cache(maxsize=4096)(eja_terbilang)
+
+terbilang = _terbilang_cache()
+
+def terbilang_series(s):
+    # Versi untuk Series: setiap nominal unik cukup dieja sekali
+    nominal = pd.to_numeric(s, errors='coerce').fillna(0).astype('int64')
+    return nominal.map({n: terbilang(n) for n in nominal.unique()})
 
 def init_default():
     if get_data("users").empty:
         add_row("users", ['admin', hash_pass('admin123'), 'admin', 'Bendahara'])
+    if get_data("warga").empty:
+        add_rows("warga", [[str(uuid.uuid4())[:8], no, nama, nominal] for no, nama, nominal in WARGA_DEFAULT])
 
 # --- MAIN APP ---
+def form_import(worksheet_name, petunjuk):
+    # Unggah -> pratinjau (dry-run) -> simpan baris valid
+    st.caption(petunjuk)
+    f = st.file_uploader("File", type=["csv", "xlsx"], key=f"import_{worksheet_name}")
+    if f is None: return
+    try:
+        preview = import_massal(worksheet_name, read_import_chunks(io.BytesIO(f.getvalue()), f.name), st.session_state['username'])
+    except (ImportError, ValueError) as e:
+        st.error(f"File tidak bisa dibaca: {e}"); return
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Baris Valid", preview["valid"]); c2.metric("Baris Error", len(preview["errors"]))
+    if worksheet_name == "transaksi":
+        saldo = get_summary_store().ensure(get_data).snapshot()["saldo"]
+        delta = preview["pemasukan"] - preview["pengeluaran"]
+        c3.metric("Saldo Setelah Import", f"Rp {saldo + delta:,.0f}", f"{delta:+,.0f}")
+    else: c3.metric("Total Setoran", f"Rp {preview['total']:,.0f}")
+    if preview["errors"]:
+        with st.expander(f"⚠️ {len(preview['errors'])} baris tidak valid (tidak akan disimpan)"):
+            st.text("\n".join(preview["errors"][:500]))
+    if preview["valid"] and st.button(f"Simpan {preview['valid']} Baris", key=f"simpan_import_{worksheet_name}"):
+        hasil = import_massal(worksheet_name, read_import_chunks(io.BytesIO(f.getvalue()), f.name), st.session_state['username'], commit=True)
+        st.success(f"{hasil['ditulis']} baris tersimpan")
+
+def report_button(kind, periode, data, render, file_name, label):
+    # Tombol laporan: render di latar belakang; sesi lain yang meminta laporan yang sama langsung memakai hasilnya
+    queue = get_report_queue()
+    key = report_key(kind, periode, data)
+    job = queue.lookup(key)
+    if job is None or job.state == "gagal":
+        if job: st.error(f"Gagal membuat laporan: {job.error}")
+        if st.button(label, key=f"lapor_{kind}"): job = queue.submit(key, f"{kind} {periode}", render)
+        else: return
+    data = queue.result(key) if job.state == "selesai" else None
+    if data is not None: st.download_button("⬇️ Download PDF", data, file_name, "application/pdf", key=f"unduh_{kind}")
+    else: _report_progress(key)
+
+@st.fragment(run_every=1.0)
+def _report_progress(key):
+    job = get_report_queue().lookup(key)
+    if job is None or job.state in ("selesai", "gagal"): st.rerun()
+    st.progress(job.progress, text=f"{'Menunggu antrean' if job.state == 'antre' else 'Membuat PDF'}... {job.progress:.0%}")
+
+def pilih_bagian(labels, key):
+    # Pengganti st.tabs: hanya bagian yang dipilih yang dijalankan, jadi worksheet bagian lain tidak ikut dibaca
+    return st.radio("Bagian", labels, horizontal=True, key=key, label_visibility="collapsed")
+
+def show_rerun_stats(halaman):
+    ctx = current_rerun()
+    if ctx is None: return
+    per_halaman = st.session_state.setdefault('baca_per_halaman', {})
+    per_halaman[halaman] = {"baca": sum(ctx.fetches.values()), "dipakai ulang": sum(ctx.reuses.values()), "worksheet": ", ".join(sorted(ctx.fetches))}
+    with st.sidebar.expander("🔎 Baca Worksheet per Halaman"):
+        st.caption(f"Rerun ini: {per_halaman[halaman]['baca']} baca, {per_halaman[halaman]['dipakai ulang']} dipakai ulang")
+        st.dataframe(pd.DataFrame.from_dict(per_halaman, orient='index'), use_container_width=True)
+
 def main():
+    with rerun_scope() as ctx:
+        try:
+            with PROFILER.timer("rerun"): run_app()
+        except SheetsUnavailable as e:
+            st.error(f"⚠️ Google Sheets sedang tidak bisa diakses ({e}). Tidak ada angka yang ditampilkan dan perubahan terakhir tidak tersimpan; coba lagi sebentar.")
+        finally:
+            if ctx.timings: st.session_state['profil_rerun_terakhir'] = ctx.timings
+
+def show_diagnostics():
+    st.header("🩺 Diagnostics")
+    PROFILER.enabled = st.toggle("Aktifkan profiling", value=PROFILER.enabled, help="Saat nonaktif, timer tidak mencatat apa pun")
+    st.caption(f"Persentil dihitung dari {PROFILER.max_samples} sampel terakhir per timer; berlaku untuk seluruh proses, bukan hanya sesi ini.")
+    report = PROFILER.report()
+    if report.empty: st.info("Belum ada data. Aktifkan profiling lalu buka halaman lain.")
+    else: st.dataframe(report.round(2), use_container_width=True, hide_index=True)
+    terakhir = st.session_state.get('profil_rerun_terakhir')
+    if terakhir:
+        st.subheader("Rerun Terakhir")
+        st.dataframe(pd.DataFrame([{"timer": k, "jumlah": n, "total_ms": t * 1000} for k, (n, t) in terakhir.items()]).sort_values("total_ms", ascending=False).round(2), use_container_width=True, hide_index=True)
+    if PROFILER.counters: st.json(PROFILER.counters)
+    c1, c2, c3 = st.columns(3)
+    stamp = datetime.now().strftime('%Y%m%d_%H%M')
+    c1.download_button("⬇️ JSON", PROFILER.export_json(), f"profil_{stamp}.json", "application/json")
+    c2.download_button("⬇️ CSV", PROFILER.export_csv(), f"profil_{stamp}.csv", "text/csv")
+    if c3.button("Reset"): PROFILER.reset(); st.session_state.pop('profil_rerun_terakhir', None); st.rerun()
+
+def run_app():
     st.set_page_config(page_title="Sistem RT Dashboard Pro", layout="wide")
     
     # Sidebar Setup
     with st.sidebar:
         if st.checkbox("⚙️ Setup DB"):
             if st.button("Buat Header"):
-                sheet = connect_db()
                 try:
-                    for s in ["tunggakan", "arisan_peserta", "arisan_bayar", "kategori"]: 
-                        try: sheet.add_worksheet(s, 100, 10) 
-                        except: pass
-                    sheet.worksheet("tunggakan").update(range_name='A1', values=[['id','nama_warga','periode','nominal','status']])
-                    sheet.worksheet("arisan_peserta").update(range_name='A1', values=[['id','nama_warga','status_menang']])
-                    sheet.worksheet("arisan_bayar").update(range_name='A1', values=[['id','nama_warga','periode','nominal','status_bayar','tanggal_bayar']])
-                    sheet.worksheet("kategori").update(range_name='A1', values=[['id','nama','jenis']])
+                    get_backend().setup()
                     st.success("Siap!")
                 except: pass
 
@@ -264,13 +2413,12 @@ def main():
         user = st.text_input("Username")
         pwd = st.text_input("Password", type='password')
         if st.button("Masuk"):
-            df = get_data("users")
-            if not df.empty:
-                df['username'] = df['username'].astype(str)
-                match = df[(df['username']==user) & (df['password']==hash_pass(pwd))]
-                if not match.empty:
-                    st.session_state.update({'logged_in':True, 'role':match.iloc[0]['role'], 'nama':match.iloc[0]['nama_lengkap'], 'username':match.iloc[0]['username']})
+            if get_user_directory().ensure(get_data).users:
+                rec, pesan = authenticate(user, pwd)
+                if rec:
+                    st.session_state.update({'logged_in':True, 'role':rec['role'], 'nama':rec['nama_lengkap'], 'username':str(rec['username'])})
                     st.rerun()
+                st.error(pesan)
             else:
                 if st.button("Init Admin"): init_default()
         return
@@ -279,7 +2427,7 @@ def main():
     st.sidebar.title(f"Hi, {st.session_state['nama']}")
     
     # MENU ADMIN UPDATE: Menambahkan 'Cetak Kwitansi'
-    menu_admin = ["Dashboard", "Input Kas", "Riwayat Kas", "Kelola Arisan", "Kelola Tunggakan", "Cetak Kwitansi", "Kelola Kategori", "User Management", "Laporan Kas"]
+    menu_admin = ["Dashboard", "Input Kas", "Riwayat Kas", "Kelola Arisan", "Kelola Tunggakan", "Cetak Kwitansi", "Kelola Kategori", "User Management", "Laporan Kas", "Diagnostics"]
     menu_warga = ["Dashboard", "Riwayat Kas", "Info Arisan", "Info Tunggakan", "Laporan Kas"]
     
     menu = menu_admin if st.session_state['role'] == 'admin' else menu_warga
@@ -287,62 +2435,76 @@ def main():
     
     if st.sidebar.button("Keluar"): st.session_state.clear(); st.rerun()
 
+    if st.session_state['role'] == 'admin':
+        with st.sidebar.expander("📡 Status Koneksi"):
+            backend = get_backend()
+            if backend.name == "sheets":
+                ps = get_sheets_pool().summary()
+                st.caption(f"Reconnect: {ps['reconnect']} | Panggilan: {ps['panggilan']} | Gagal: {ps['gagal']}")
+                st.caption(f"Latensi rata-rata {ps['latensi_rata2']*1000:.0f} ms | terakhir {ps['latensi_terakhir']*1000:.0f} ms | maks {ps['latensi_maks']*1000:.0f} ms")
+                st.caption(f"Kuota: {ps['kuota_429']}x 429 | diulang {ps['diulang']} | baca digabung {ps['digabung']} | antre {ps['antre_detik']:.1f} s")
+                cs = get_sheet_cache().summary()
+                st.caption(f"Cache: {cs['hit']} hit / {cs['miss']} miss ({cs['rasio_hit']:.0%}) | {cs['entri']} worksheet, {cs['memori']/1024:.0f} KB | evict {cs['evict']}")
+                if st.button("Kosongkan Cache"): get_sheet_cache().invalidate(); st.rerun()
+            else:
+                bs = backend.summary()
+                st.caption(f"SQLite lokal ({backend.path}) | Query: {bs['query']} | rata-rata {bs['latensi_rata2']*1000:.1f} ms")
+                if 'sync' in bs:
+                    st.caption(f"Sync: {bs['sync']['terkirim']} operasi terkirim, {bs['sync']['ditarik']} baris ditarik")
+                    if bs['sync']['error']: st.caption(f"Error terakhir: {bs['sync']['error']}")
+
+    if get_backend().name == "sync":
+        ss = get_backend().engine.summary()
+        terakhir = ss['terakhir_sync'].strftime('%H:%M:%S') if ss['terakhir_sync'] else "-"
+        st.sidebar.caption(f"{'🔴' if ss['gagal_beruntun'] else '🟢'} Sync Sheets | antrean {ss['antrean']} | terakhir {terakhir} | gagal {ss['gagal']}")
+
     # --- 1. DASHBOARD ---
     if choice == "Dashboard":
         st.header("📊 Dashboard Keuangan RT")
         
-        df = get_data("transaksi")
-        df_t = get_data("tunggakan")
-        
-        saldo = 0
-        pemasukan_total = 0
-        pengeluaran_total = 0
-        tunggakan_total = 0
-        
-        if not df.empty:
-            df['nominal'] = pd.to_numeric(df['nominal'], errors='coerce').fillna(0)
-            df['tanggal'] = pd.to_datetime(df['tanggal'])
-            
-            pemasukan_total = df[df['tipe']=='Pemasukan']['nominal'].sum()
-            pengeluaran_total = df[df['tipe']=='Pengeluaran']['nominal'].sum()
-            saldo = pemasukan_total - pengeluaran_total
-        
-        if not df_t.empty:
-            df_t['nominal'] = pd.to_numeric(df_t['nominal'], errors='coerce').fillna(0)
-            tunggakan_total = df_t[df_t['status']=='Belum Lunas']['nominal'].sum()
+        store = get_summary_store().ensure(get_data)
+        ringkasan = store.snapshot()
 
         c1, c2, c3, c4 = st.columns(4)
-        c1.metric("💰 Saldo Kas Saat Ini", f"Rp {saldo:,.0f}")
-        c2.metric("📈 Total Pemasukan", f"Rp {pemasukan_total:,.0f}")
-        c3.metric("📉 Total Pengeluaran", f"Rp {pengeluaran_total:,.0f}")
-        c4.metric("❗ Total Tunggakan", f"Rp {tunggakan_total:,.0f}", delta_color="inverse")
+        c1.metric("💰 Saldo Kas Saat Ini", f"Rp {ringkasan['saldo']:,.0f}")
+        c2.metric("📈 Total Pemasukan", f"Rp {ringkasan['pemasukan']:,.0f}")
+        c3.metric("📉 Total Pengeluaran", f"Rp {ringkasan['pengeluaran']:,.0f}")
+        c4.metric("❗ Total Tunggakan", f"Rp {ringkasan['tunggakan']:,.0f}", delta_color="inverse")
         
         st.divider()
         st.subheader(f"Grafik Keuangan Tahun {datetime.now().year}")
-        if not df.empty:
-            df_year = df[df['tanggal'].dt.year == datetime.now().year]
-            if not df_year.empty:
-                df_year['bulan'] = df_year['tanggal'].dt.strftime('%Y-%m')
-                chart_data = df_year.groupby(['bulan', 'tipe'])['nominal'].sum().unstack().fillna(0)
-                if 'Pemasukan' not in chart_data.columns: chart_data['Pemasukan'] = 0
-                if 'Pengeluaran' not in chart_data.columns: chart_data['Pengeluaran'] = 0
+        if ringkasan['jumlah_transaksi']:
+            chart_data = store.monthly(datetime.now().year)
+            if not chart_data.empty:
                 st.bar_chart(chart_data[['Pemasukan', 'Pengeluaran']], color=["#4CAF50", "#FF4B4B"])
             else: st.info("Belum ada transaksi di tahun ini.")
         else: st.info("Belum ada data transaksi kas.")
 
+        if st.session_state['role'] == 'admin':
+            with st.expander("🔄 Verifikasi Ringkasan"):
+                st.caption("Ringkasan diperbarui bertahap setiap ada transaksi. Hitung ulang dari seluruh data untuk memastikan angkanya cocok.")
+                if st.button("Hitung Ulang dari Awal"):
+                    # Hasil disimpan di session_state agar tetap terlihat setelah rerun
+                    st.session_state['hasil_hitung_ulang'] = store.rebuild(get_data)
+                    st.rerun()
+                cocok = st.session_state.pop('hasil_hitung_ulang', None)
+                if cocok is True: st.success("Ringkasan cocok dengan data lengkap.")
+                elif cocok is False: st.warning("Ringkasan berbeda dari data lengkap dan sudah diperbaiki.")
+
     # --- 2. RIWAYAT KAS ---
     elif choice == "Riwayat Kas":
         st.header("🗂️ Riwayat Transaksi Kas")
         df = get_data("transaksi")
+        if get_arsip().manifest: st.caption(f"Periode tutup buku ({', '.join(e['periode'] for e in get_arsip().manifest)}) ada di arsip dan bisa dilihat lewat Laporan Kas.")
         if not df.empty:
             st.dataframe(df.sort_values(by='tanggal', ascending=False), use_container_width=True)
             if st.session_state['role'] == 'admin':
                 st.divider()
                 with st.expander("🗑️ Hapus Transaksi (Admin Only)"):
-                    id_del = st.text_input("Masukkan ID Transaksi untuk dihapus")
-                    if st.button("Hapus Permanen"):
-                        delete_row_by_id("transaksi", id_del)
-                        st.success("Transaksi berhasil dihapus.")
+                    id_del = st.multiselect("Pilih ID Transaksi untuk dihapus", df['id'].tolist())
+                    if st.button("Hapus Permanen") and id_del:
+                        n = delete_rows_by_ids("transaksi", id_del)
+                        st.success(f"{n} transaksi berhasil dihapus.")
                         st.rerun()
         else: st.info("Belum ada data riwayat transaksi.")
 
@@ -360,21 +2522,28 @@ def main():
             tgl = st.date_input("Tanggal", datetime.now())
             nom = st.number_input("Nominal", step=1000)
             kat = st.selectbox("Kategori", cats)
+            df_w = get_data("warga") if jenis == "Pemasukan" else pd.DataFrame()
+            warga = st.selectbox(f"Warga (untuk {IURAN_KATEGORI})", ["-"] + (df_w['nama'].tolist() if not df_w.empty else []))
             ket = st.text_area("Ket")
             if st.form_submit_button("Simpan"):
+                if get_arsip().entry_for(tgl.year, tgl.month): st.error("Bulan ini sudah tutup buku, transaksi tidak bisa ditambahkan."); st.stop()
+                if warga != "-" and warga.lower() not in ket.lower(): ket = f"Iuran {warga}" + (f" - {ket}" if ket else "")
                 add_row("transaksi", [str(uuid.uuid4())[:8], str(tgl), jenis, kat, nom, ket, st.session_state['username'], "-"])
                 st.success("Ok")
 
+        with st.expander("📥 Import Massal (CSV/XLSX)"):
+            form_import("transaksi", "Kolom: tanggal, tipe, kategori, nominal, keterangan")
+
     # --- 4. KELOLA TUNGGAKAN ---
     elif choice == "Kelola Tunggakan" or choice == "Info Tunggakan":
         st.header("❗ Manajemen Tunggakan")
-        tab1, tab2, tab3 = st.tabs(["Daftar & Edit", "Tambah Data", "Laporan PDF"])
+        bagian = pilih_bagian(["Daftar & Edit", "Tambah Data", "Laporan PDF"], "bagian_tunggakan")
         
-        with tab1:
+        if bagian == "Daftar & Edit":
             df_t = get_data("tunggakan")
             if not df_t.empty:
                 if st.session_state['role'] == 'admin':
-                    edited = st.data_editor(df_t, column_config={"id": st.column_config.TextColumn(disabled=True), "status": st.column_config.SelectboxColumn(options=["Belum Lunas", "Lunas"])}, hide_index=True)
+                    edited = st.data_editor(df_t, column_config={"id": st.column_config.TextColumn(disabled=True), "periode_key": st.column_config.TextColumn(disabled=True), "status": st.column_config.SelectboxColumn(options=["Belum Lunas", "Lunas"])}, hide_index=True)
                     if st.button("Simpan Perubahan"): save_all_data("tunggakan", edited); st.success("Disimpan!"); st.rerun()
                     with st.expander("Hapus Data"):
                           id_del = st.text_input("Masukkan ID untuk Hapus")
@@ -382,7 +2551,7 @@ def main():
                 else: st.dataframe(df_t[df_t['status']=='Belum Lunas'])
             else: st.info("Kosong")
 
-        with tab2:
+        if bagian == "Tambah Data":
             if st.session_state['role'] == 'admin':
                 with st.form("add_t"):
                     n = st.text_input("Nama"); p = st.text_input("Periode"); nom = st.number_input("Nominal", step=5000)
@@ -391,33 +2560,41 @@ def main():
                         add_row("tunggakan", [str(uuid.uuid4())[:8], n, p, nom, s]); st.success("Ok")
             else: st.warning("Akses Admin")
 
-        with tab3:
-            df_t = get_data("tunggakan")
-            ft = st.text_input("Cari Periode (Cth: Jan 2026)")
-            if not df_t.empty:
-                if ft: df_t = df_t[df_t['periode'].str.contains(ft, case=False, na=False)]
+        if bagian == "Laporan PDF":
+            idx_t = get_tunggakan_index().ensure(get_data)
+            ft = st.text_input("Cari Periode / Nama (Cth: Jan 2026)")
+            if idx_t.rows:
+                df_t = idx_t.search(ft)
                 st.dataframe(df_t)
-                if st.button("Download PDF Tunggakan"):
-                    pdf = create_pdf_universal(df_t, f"Laporan Tunggakan ({ft})", ['Nama', 'Periode', 'Nominal', 'Status'], ['nama_warga', 'periode', 'nominal', 'status'], [50, 50, 40, 40])
-                    st.download_button("Download", pdf, "tunggakan.pdf")
+                with st.expander("⏳ Umur Tunggakan per Warga"):
+                    st.dataframe(idx_t.aging(date.today()), use_container_width=True)
+                report_button("tunggakan", ft or "semua", df_t,
+                              lambda progress: create_pdf_universal(df_t, f"Laporan Tunggakan ({ft})", ['Nama', 'Periode', 'Nominal', 'Status'], ['nama_warga', 'periode', 'nominal', 'status'], [50, 50, 40, 40], progress=progress),
+                              "tunggakan.pdf", "Download PDF Tunggakan")
 
     # --- 5. KELOLA ARISAN ---
     elif choice == "Kelola Arisan" or choice == "Info Arisan":
         st.header("🎲 Manajemen Arisan")
-        tab1, tab2, tab3 = st.tabs(["Peserta & Kocokan", "Pembayaran", "Laporan PDF"])
+        bagian = pilih_bagian(["Peserta & Kocokan", "Pembayaran", "Laporan PDF"], "bagian_arisan")
         
-        with tab1:
+        if bagian == "Peserta & Kocokan":
             if st.session_state['role']=='admin':
+                status_kocok = get_draw_engine().state()
                 if st.button("🎲 KOCOK ARISAN"):
-                    msg, win = kocok_pemenang()
+                    msg, win = kocok_pemenang(st.session_state.get('putaran_arisan'), st.session_state['username'])
                     if win: st.balloons(); st.success(msg)
                     else: st.warning(msg)
+                    status_kocok = get_draw_engine().state()
+                st.session_state['putaran_arisan'] = status_kocok['putaran']
+                st.caption(f"Putaran ke-{status_kocok['putaran']} | sisa kandidat: {len(status_kocok['sisa'])}")
+                with st.expander("📜 Log Kocokan"):
+                    st.dataframe(get_data("arisan_log"), use_container_width=True)
                 with st.expander("Tambah Peserta"):
                     nm = st.text_input("Nama Baru")
                     if st.button("Simpan Peserta"): add_row("arisan_peserta", [str(uuid.uuid4())[:8], nm, 'Belum']); st.rerun()
             st.dataframe(get_data("arisan_peserta"), use_container_width=True)
 
-        with tab2:
+        if bagian == "Pembayaran":
             if st.session_state['role']=='admin':
                 with st.form("bayar_ar"):
                     df_p = get_data("arisan_peserta")
@@ -426,62 +2603,32 @@ def main():
                     if st.form_submit_button("Bayar"):
                         add_row("arisan_bayar", [str(uuid.uuid4())[:8], n, p, nom, 'Lunas', str(datetime.now().date())])
                         st.success("Ok"); st.rerun()
+                with st.expander("📥 Import Massal (CSV/XLSX)"):
+                    form_import("arisan_bayar", "Kolom: nama_warga, periode, nominal, tanggal_bayar")
             st.dataframe(get_data("arisan_bayar"))
 
-        with tab3:
+        if bagian == "Laporan PDF":
             c_m, c_y = st.columns(2)
             sel_month = c_m.selectbox("Bulan", list(get_month_map().keys()))
             sel_year = c_y.number_input("Tahun", min_value=2020, value=datetime.now().year)
-            df_ab = filter_by_date(get_data("arisan_bayar"), 'tanggal_bayar', sel_month, sel_year)
+            tabel_ab = load_typed("arisan_bayar")
+            show_parse_errors(tabel_ab, "arisan_bayar")
+            df_ab = tabel_ab.month(sel_year, get_month_map()[sel_month])
             st.dataframe(df_ab)
-            if not df_ab.empty and st.button("Download PDF Arisan"):
-                pdf = create_pdf_universal(df_ab, f"Arisan {sel_month} {sel_year}", ['Nama', 'Periode', 'Nominal', 'Tgl'], ['nama_warga', 'periode', 'nominal', 'tanggal_bayar'], [50, 40, 40, 40])
-                st.download_button("Download", pdf, "arisan.pdf")
+            if not df_ab.empty:
+                report_button("arisan", f"{sel_year}-{sel_month}", df_ab,
+                              lambda progress: create_pdf_universal(df_ab, f"Arisan {sel_month} {sel_year}", ['Nama', 'Periode', 'Nominal', 'Tgl'], ['nama_warga', 'periode', 'nominal', 'tanggal_bayar'], [50, 40, 40, 40], progress=progress),
+                              "arisan.pdf", "Download PDF Arisan")
     
     # --- 6. CETAK KWITANSI (FITUR BARU) ---
     elif choice == "Cetak Kwitansi":
         st.header("🖨️ Cetak Kwitansi Iuran RT")
         st.write("Menu ini digunakan untuk mencetak kwitansi bulanan.")
 
-        # DATA WARGA (Hardcode sesuai permintaan)
-        data_warga = [
-            {"no": 1, "nama": "Indomaret", "nominal": 460000},
-            {"no": 2, "nama": "Suparman", "nominal": 160000},
-            {"no": 3, "nama": "Aji Pamungkas", "nominal": 60000},
-            {"no": 4, "nama": "Andre Christianto", "nominal": 100000},
-            {"no": 5, "nama": "Hj. Darwin", "nominal": 60000},
-            {"no": 6, "nama": "Soedarnoto", "nominal": 60000},
-            {"no": 7, "nama": "dr. Eko Andrianto", "nominal": 100000},
-            {"no": 8, "nama": "Djoko S", "nominal": 60000},
-            {"no": 9, "nama": "H. Suwindi I", "nominal": 60000},
-            {"no": 10, "nama": "H. Suwindi II", "nominal": 50000},
-            {"no": 11, "nama": "Yusuf", "nominal": 60000},
-            {"no": 12, "nama": "Hj. Ngarjojo", "nominal": 60000},
-            {"no": 13, "nama": "Safri", "nominal": 60000},
-            {"no": 14, "nama": "H. Komarudin", "nominal": 60000},
-            {"no": 15, "nama": "Hj. Yuyanti I", "nominal": 60000},
-            {"no": 16, "nama": "Hj. Yuyanti II", "nominal": 60000},
-            {"no": 17, "nama": "H. Nugroho S", "nominal": 60000},
-            {"no": 18, "nama": "Amba Kosasih", "nominal": 60000},
-            {"no": 19, "nama": "Wawan", "nominal": 60000},
-            {"no": 20, "nama": "H. Hadi Djuweni", "nominal": 60000},
-            {"no": 21, "nama": "Priyo Utomo", "nominal": 60000},
-            {"no": 22, "nama": "Hamid", "nominal": 60000},
-            {"no": 23, "nama": "H. Hadi Sulistyo", "nominal": 95000},
-            {"no": 24, "nama": "Singgih Djarwanto", "nominal": 60000},
-            {"no": 25, "nama": "Nurhaini Agus S", "nominal": 60000},
-            {"no": 26, "nama": "Joko P", "nominal": 60000},
-            {"no": 27, "nama": "Lulus A", "nominal": 60000},
-            {"no": 28, "nama": "Liliek Djito", "nominal": 60000},
-            {"no": 29, "nama": "Budi Santoso", "nominal": 60000},
-            {"no": 30, "nama": "H. Slamet Kaslan", "nominal": 60000},
-            {"no": 31, "nama": "Annie H", "nominal": 60000},
-            {"no": 32, "nama": "Joni", "nominal": 60000},
-            {"no": 33, "nama": "Dayatno", "nominal": 60000},
-            {"no": 34, "nama": "Arif Munandar", "nominal": 60000},
-            {"no": 35, "nama": "Sie Sien", "nominal": 60000},
-            {"no": 36, "nama": "Taman RT / Lukman", "nominal": 100000},
-        ]
+        matriks = get_payment_matrix().ensure(get_data)
+        if matriks.warga.empty:
+            st.warning("Data warga masih kosong.")
+            if st.button("Isi Data Warga Bawaan"): init_default(); st.rerun()
 
         col1, col2 = st.columns(2)
         with col1:
@@ -491,33 +2638,27 @@ def main():
         with col2:
             pilih_tahun = st.number_input("Tahun", min_value=2024, max_value=2030, value=date.today().year)
 
-        if st.button("📄 Generate PDF Kwitansi"):
-            pdf = KwitansiPDF(orientation='P', unit='mm', format='A4')
-            pdf.set_auto_page_break(auto=False, margin=0)
-            pdf.add_page()
+        sudah_bayar, belum_bayar = matriks.roster(int(pilih_tahun), list_bulan.index(pilih_bulan) + 1)
+        c1, c2 = st.columns(2)
+        c1.metric("Sudah Bayar", len(sudah_bayar)); c2.metric("Belum Bayar", len(belum_bayar))
+        with st.expander(f"📊 Matriks Iuran {pilih_tahun}"):
+            st.caption(f"Dari transaksi kategori '{IURAN_KATEGORI}' yang keterangannya memuat nama warga")
+            st.dataframe(matriks.matrix(int(pilih_tahun)), use_container_width=True)
+        with st.expander("👥 Data Warga"):
+            edited_w = st.data_editor(get_data("warga"), column_config={"id": st.column_config.TextColumn(disabled=True)}, hide_index=True, num_rows="dynamic")
+            if st.button("Simpan Data Warga"):
+                edited_w['id'] = edited_w['id'].map(lambda v: str(uuid.uuid4())[:8] if _is_blank(v) else v)
+                save_all_data("warga", edited_w); st.success("Disimpan!"); st.rerun()
 
-            margin_top = 10
-            kwitansi_height = 55
-            gap = 5
-            max_per_page = 4 # DIUBAH DARI 5 MENJADI 4 AGAR TIDAK TERPOTONG
-            counter = 0
-            current_y = margin_top
-
-            for warga in data_warga:
-                if counter >= max_per_page:
-                    pdf.add_page()
-                    counter = 0
-                    current_y = margin_top
-                
-                pdf.buat_kwitansi(warga, pilih_bulan, int(pilih_tahun), current_y)
-                current_y += kwitansi_height + gap
-                counter += 1
-
-            pdf_output = pdf.output(dest='S').encode('latin-1')
-            nama_file = f"Kwitansi_RT_{pilih_bulan}_{pilih_tahun}.pdf"
-            
-            st.success(f"Kwitansi untuk {len(data_warga)} warga berhasil dibuat!")
-            st.download_button(label="⬇️ Download File PDF", data=pdf_output, file_name=nama_file, mime="application/pdf")
+        data_warga = sudah_bayar if st.checkbox("Hanya warga yang sudah bayar", value=True) else sorted(sudah_bayar + belum_bayar, key=lambda w: w['no'])
+        if data_warga:
+            report_button("kwitansi", f"{pilih_tahun}-{pilih_bulan}", data_warga,
+                          lambda progress: render_kwitansi(data_warga, pilih_bulan, int(pilih_tahun), progress),
+                          f"Kwitansi_RT_{pilih_bulan}_{pilih_tahun}.pdf", f"📄 Generate PDF Kwitansi ({len(data_warga)} warga)")
+
+        if belum_bayar and st.button(f"❗ Buka Tunggakan untuk {len(belum_bayar)} Warga Belum Bayar"):
+            n = buka_tunggakan(belum_bayar, pilih_bulan, int(pilih_tahun))
+            st.success(f"{n} tunggakan baru dibuat" + (f", {len(belum_bayar) - n} sudah tercatat sebelumnya" if n < len(belum_bayar) else ""))
 
     # --- 7. KELOLA KATEGORI ---
     elif choice == "Kelola Kategori":
@@ -531,7 +2672,7 @@ def main():
                 st.rerun()
         else:
             if st.button("Init Kategori"): 
-                add_row("kategori", ["1", "Iuran", "Pemasukan"])
+                add_row("kategori", ["1", IURAN_KATEGORI, "Pemasukan"])
                 st.rerun()
 
     # --- 8. LAPORAN & USER ---
@@ -540,18 +2681,41 @@ def main():
         c_m, c_y = st.columns(2)
         sel_month = c_m.selectbox("Bulan", list(get_month_map().keys()), key="kas_m")
         sel_year = c_y.number_input("Tahun", min_value=2020, value=datetime.now().year, key="kas_y")
-        df = filter_by_date(get_data("transaksi"), 'tanggal', sel_month, sel_year)
+        show_parse_errors(load_typed("transaksi"), "transaksi")
+        df, dari_arsip = transaksi_bulan(sel_year, get_month_map()[sel_month])
+        if dari_arsip: st.caption("📦 Periode ini sudah tutup buku; data dari arsip.")
         st.dataframe(df)
-        if not df.empty and st.button("Download PDF Kas"):
-             pdf = create_pdf_universal(df, f"Kas {sel_month} {sel_year}", ['Tgl', 'Tipe', 'Kat', 'Nominal'], ['tanggal', 'tipe', 'kategori', 'nominal'], [30, 30, 40, 40])
-             st.download_button("Download", pdf, "kas.pdf")
+        subtotal = st.checkbox("Subtotal per halaman", key="kas_subtotal")
+        if not df.empty:
+            report_button("kas", f"{sel_year}-{sel_month}{'-subtotal' if subtotal else ''}", df,
+                          lambda progress: create_pdf_universal(df, f"Kas {sel_month} {sel_year}", ['Tgl', 'Tipe', 'Kat', 'Nominal'], ['tanggal', 'tipe', 'kategori', 'nominal'], [30, 30, 40, 40], subtotal_per_halaman=subtotal, progress=progress),
+                          "kas.pdf", "Download PDF Kas")
+
+        if st.session_state['role'] == 'admin':
+            with st.expander("📦 Tutup Buku"):
+                st.caption("Periode yang ditutup disalin ke worksheet arsip, dibekukan (tidak bisa diubah), lalu dihapus dari data live.")
+                arsip = get_arsip()
+                if arsip.manifest: st.dataframe(pd.DataFrame(arsip.manifest)[['periode', 'baris', 'ditutup_oleh', 'waktu']], hide_index=True)
+                periode = st.text_input("Periode (YYYY atau YYYY-MM)", key="tutup_periode")
+                if st.button("Tutup Buku") and periode:
+                    try:
+                        entry, n = tutup_buku(periode, st.session_state['username'])
+                        st.success(f"Periode {entry['periode']}: {entry['baris']} transaksi diarsipkan, {n} baris dihapus dari data live.")
+                    except (ValueError, ImportError, IOError) as e: st.error(str(e))
 
     elif choice == "User Management":
         with st.form("u"):
             u=st.text_input("User"); p=st.text_input("Pass", type='password'); r=st.selectbox("Role",["warga","admin"])
-            if st.form_submit_button("Add"): add_row("users",[u,hash_pass(p),r,u]); st.success("Ok")
+            if st.form_submit_button("Add"):
+                if u in get_user_directory().ensure(get_data).users: st.error("Username sudah dipakai")
+                else: add_row("users",[u,hash_pass(p),r,u]); st.success("Ok")
         st.dataframe(get_data("users"))
 
+    elif choice == "Diagnostics":
+        show_diagnostics()
+
+    if st.session_state['role'] == 'admin': show_rerun_stats(choice)
+
 if __name__ == '__main__':
     main()
 
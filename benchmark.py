@@ -0,0 +1,230 @@
+# Benchmark & verifikasi offline untuk aplikasi RT
+#
+#   python benchmark.py terbilang              -> micro-benchmark terbilang lama vs baru
+#   python benchmark.py terbilang --verify     -> cek kebenaran 0..10^7 (bisa diubah dengan --sampai)
+#   python benchmark.py suite                  -> dashboard/laporan/hapus/kocok/kwitansi di atas fake Sheets 1k/10k/100k baris
+#   python benchmark.py suite --banding benchmark_hasil/X.json  -> bandingkan dengan hasil sebelumnya
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+import timeit
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+
+import app
+import fake_sheets
+
+# --- TERBILANG ---
+def terbilang_lama(n):
+    # Implementasi rekursif sebelumnya, disimpan sebagai pembanding (hanya benar untuk 1..999999)
+    angka = ["", "Satu", "Dua", "Tiga", "Empat", "Lima", "Enam", "Tujuh", "Delapan", "Sembilan", "Sepuluh", "Sebelas"]
+    hasil = ""
+    n = int(n)
+    if n >= 0 and n <= 11:
+        hasil = angka[n]
+    elif n < 20:
+        hasil = terbilang_lama(n - 10) + " Belas"
+    elif n < 100:
+        hasil = terbilang_lama(n / 10) + " Puluh " + terbilang_lama(n % 10)
+    elif n < 200:
+        hasil = "Seratus " + terbilang_lama(n - 100)
+    elif n < 1000:
+        hasil = terbilang_lama(n / 100) + " Ratus " + terbilang_lama(n % 100)
+    elif n < 2000:
+        hasil = "Seribu " + terbilang_lama(n - 1000)
+    elif n < 1000000:
+        hasil = terbilang_lama(n / 1000) + " Ribu " + terbilang_lama(n % 1000)
+    return hasil.strip()
+
+def baca_terbilang(teks):
+    # Kebalikan terbilang(): kata -> angka, untuk memeriksa hasil di luar jangkauan implementasi lama
+    nilai_angka = {k: i for i, k in enumerate(app.ANGKA) if k}
+    skala = {nama: nilai for nilai, nama in app.SKALA}
+    total, kelompok, terakhir = 0, 0, 0
+    for kata in teks.split():
+        if kata == "Nol": continue
+        if kata in nilai_angka:
+            terakhir = nilai_angka[kata]
+            kelompok += terakhir
+        elif kata == "Belas": kelompok += 10
+        elif kata == "Puluh": kelompok += terakhir * 9
+        elif kata == "Ratus": kelompok += terakhir * 99
+        elif kata == "Seratus": kelompok += 100
+        elif kata == "Seribu": total += 1000
+        elif kata in skala:
+            total += kelompok * skala[kata]
+            kelompok = 0
+        else: raise ValueError(f"Kata tidak dikenal: {kata!r} dalam {teks!r}")
+    return total + kelompok
+
+def verify_terbilang(sampai):
+    eja = app.eja_terbilang # tanpa cache agar setiap angka benar-benar dihitung
+    assert eja(0) == "Nol"
+    for n in range(1, sampai + 1):
+        teks = eja(n)
+        if n < 1000000 and teks != terbilang_lama(n): raise AssertionError(f"{n}: {teks!r} != {terbilang_lama(n)!r}")
+        if baca_terbilang(teks) != n: raise AssertionError(f"{n}: {teks!r} terbaca {baca_terbilang(teks)}")
+        if n % 1000000 == 0: print(f"  {n:,} ok")
+    for n in (10**9, 10**12, 10**15 - 1, 2 * 10**9 + 1):
+        assert baca_terbilang(eja(n)) == n, n
+    print(f"terbilang benar untuk 0..{sampai:,}")
+
+def bench_terbilang(jumlah):
+    # Campuran nominal iuran yang realistis: sebagian besar nominal sama (60000), sisanya acak
+    nominal = [random.choice([60000, 60000, 60000, 100000, 50000, 460000, random.randint(1, 999999)]) for _ in range(jumlah)]
+    seri = pd.Series(nominal)
+    hasil = {
+        "lama (rekursif)": timeit.timeit(lambda: [terbilang_lama(n) for n in nominal], number=3) / 3,
+        "baru tanpa cache": timeit.timeit(lambda: [app.eja_terbilang(n) for n in nominal], number=3) / 3,
+        "baru dengan cache": timeit.timeit(lambda: [app.terbilang(n) for n in nominal], number=3) / 3,
+        "terbilang_series": timeit.timeit(lambda: app.terbilang_series(seri), number=3) / 3,
+    }
+    for nama, detik in hasil.items(): print(f"{nama:<20} {detik * 1000:9.2f} ms untuk {jumlah:,} nominal")
+    return hasil
+
+# --- SUITE DI ATAS FAKE SHEETS ---
+KATEGORI = [("Denda", "Pemasukan"), ("Donasi", "Pemasukan"), ("Iuran Warga", "Pemasukan"), ("Kas Kegiatan", "Pemasukan"),
+            ("Keamanan", "Pengeluaran"), ("Kebersihan", "Pengeluaran"), ("Konsumsi Rapat", "Pengeluaran"), ("Perbaikan Fasilitas", "Pengeluaran")]
+
+def seed_sheets(client, n, rng):
+    # n baris transaksi dan n baris tunggakan selama 3 tahun, plus master data seukuran RT sungguhan
+    sh = client.create(app.SHEET_NAME)
+    h = app.WORKSHEET_HEADERS
+    warga = [nama for _, nama, _ in app.WARGA_DEFAULT]
+    bulan = list(app.get_month_map())
+    awal = date(2024, 1, 1)
+    tanggal = sorted(awal + timedelta(days=rng.randrange(3 * 365)) for _ in range(n))
+    trx = []
+    for i, tgl in enumerate(tanggal):
+        kat, tipe = rng.choice(KATEGORI[:3] * 4 + KATEGORI)
+        ket = f"Iuran {rng.choice(warga)}" if kat == "Iuran Warga" else "-"
+        trx.append([f"t{i:07d}", tgl.isoformat(), tipe, kat, rng.choice([60000, 100000, 160000, 250000, 1500000]), ket, "admin", "-"])
+    sh.seed("transaksi", h["transaksi"], trx)
+    tung = []
+    for i in range(n):
+        y, m = 2024 + rng.randrange(3), rng.randrange(12)
+        tung.append([f"g{i:07d}", rng.choice(warga), f"{bulan[m]} {y}", rng.choice([60000, 100000]), rng.choice(["Belum Lunas", "Lunas"]), f"{y:04d}-{m + 1:02d}"])
+    sh.seed("tunggakan", h["tunggakan"], tung)
+    sh.seed("users", h["users"], [["admin", app.hash_pass("admin123"), "admin", "Bendahara"]])
+    sh.seed("kategori", h["kategori"], [[i + 1, k, j] for i, (k, j) in enumerate(KATEGORI)])
+    sh.seed("warga", h["warga"], [[f"w{no:03d}", no, nama, nominal] for no, nama, nominal in app.WARGA_DEFAULT])
+    sh.seed("arisan_peserta", h["arisan_peserta"], [[f"p{i:03d}", nama, "Belum"] for i, nama in enumerate(warga)])
+    sh.seed("arisan_bayar", h["arisan_bayar"], [[f"b{i:07d}", rng.choice(warga), "Jan 2026", 100000, "Lunas", "2026-01-05"] for i in range(max(1, n // 10))])
+    sh.seed("arisan_log", h["arisan_log"], [])
+    return [r[0] for r in trx]
+
+def _cache_dingin():
+    app.get_sheet_cache().invalidate()
+    app.get_typed_tables().invalidate()
+    app.get_summary_store().invalidate()
+    app.get_tunggakan_index().apply()
+
+def skenario(ids):
+    # nama -> fungsi satu putaran; setiap fungsi mengulang jalur yang sama dengan halaman di app.py
+    ids = iter(ids[::-1])
+    data_kwitansi = [{"no": no, "nama": nama, "nominal": nominal} for no, nama, nominal in app.WARGA_DEFAULT]
+    antrean = app.ReportQueue(app.ReportCache(os.path.join(tempfile.gettempdir(), "benchmark_laporan"), 64 * 1024 * 1024), 1)
+    def dashboard_dingin():
+        _cache_dingin()
+        store = app.get_summary_store().ensure(app.get_data)
+        store.snapshot(); store.monthly(2026)
+    def dashboard_hangat():
+        store = app.get_summary_store().ensure(app.get_data)
+        store.snapshot(); store.monthly(2026)
+    def laporan_pdf():
+        _cache_dingin()
+        df = app.load_typed("transaksi").month(2025, 10)
+        app.create_pdf_universal(df, "Kas Oktober 2025", ['Tgl', 'Tipe', 'Kat', 'Nominal'], ['tanggal', 'tipe', 'kategori', 'nominal'], [30, 30, 40, 40])
+    def cari_tunggakan():
+        _cache_dingin()
+        app.get_tunggakan_index().ensure(app.get_data).search("Jan 2026")
+    def hapus():
+        app.delete_row_by_id("transaksi", next(ids))
+    def kocok():
+        app.kocok_pemenang(admin="benchmark")
+    def kwitansi():
+        # Jalur tombol Generate PDF Kwitansi: lewat antrean laporan, PDF di cache disk dibuang dulu agar selalu dirender
+        key = app.report_key("kwitansi", "2026-Januari", data_kwitansi)
+        antrean.cache.discard(key)
+        job = antrean.submit(key, "kwitansi", lambda progress: app.render_kwitansi(data_kwitansi, "Januari", 2026, progress))
+        job.done.wait()
+        if job.state == "gagal": raise RuntimeError(job.error)
+    return {"dashboard (dingin)": dashboard_dingin, "dashboard (hangat)": dashboard_hangat, "laporan kas + pdf": laporan_pdf,
+            "cari tunggakan": cari_tunggakan, "hapus transaksi": hapus, "kocok arisan": kocok, "kwitansi 36 warga": kwitansi}
+
+def run_suite(ukuran, ulang, latensi, rasio_kuota, seed):
+    os.environ["STORAGE_BACKEND"] = "sheets"
+    hasil = []
+    for n in ukuran:
+        rng = random.Random(seed)
+        client = fake_sheets.FakeClient(latensi=latensi, rasio_kuota=rasio_kuota, seed=seed)
+        ids = seed_sheets(client, n, rng)
+        app.get_sheets_pool().set_authorizer(lambda: client)
+        _cache_dingin()
+        app.get_draw_engine().invalidate()
+        for nama, fn in skenario(ids).items():
+            waktu, panggilan, gagal = [], [], 0
+            for _ in range(ulang):
+                sebelum = client.stats["panggilan"]
+                t0 = time.perf_counter()
+                try: fn()
+                except Exception: gagal += 1
+                waktu.append(time.perf_counter() - t0)
+                panggilan.append(client.stats["panggilan"] - sebelum)
+            baris = {"ukuran": n, "skenario": nama, "median_ms": statistics.median(waktu) * 1000, "min_ms": min(waktu) * 1000,
+                     "maks_ms": max(waktu) * 1000, "panggilan_api": statistics.mean(panggilan), "gagal": gagal}
+            hasil.append(baris)
+            print(f"{n:>7,} {nama:<20} {baris['median_ms']:10.1f} ms  (min {baris['min_ms']:.1f}, {baris['panggilan_api']:.1f} panggilan API{f', {gagal} gagal' if gagal else ''})")
+    return hasil
+
+def _git_rev():
+    try: return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError: return ""
+
+def simpan_hasil(hasil, path, meta):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f: json.dump({**meta, "git": _git_rev(), "waktu": datetime.now().isoformat(timespec='seconds'), "hasil": hasil}, f, indent=2)
+    print(f"hasil disimpan ke {path}")
+
+def banding(hasil, path):
+    with open(path) as f: lama = json.load(f)
+    df = pd.DataFrame(hasil).merge(pd.DataFrame(lama["hasil"]), on=["ukuran", "skenario"], suffixes=("", "_lama"))
+    print(f"\ndibandingkan dengan {path} (git {lama.get('git', '?')}, {lama.get('waktu', '?')}):")
+    if df.empty: print("tidak ada pasangan ukuran/skenario yang sama"); return
+    df["perubahan"] = (df["median_ms"] / df["median_ms_lama"] - 1).map("{:+.0%}".format)
+    print(df[["ukuran", "skenario", "median_ms_lama", "median_ms", "perubahan", "panggilan_api_lama", "panggilan_api"]].round(1).to_string(index=False))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline aplikasi RT")
+    sub = parser.add_subparsers(dest="perintah", required=True)
+    p = sub.add_parser("terbilang", help="micro-benchmark dan verifikasi terbilang()")
+    p.add_argument("--jumlah", type=int, default=10000)
+    p.add_argument("--verify", action="store_true", help="cek kebenaran untuk seluruh 0..SAMPAI")
+    p.add_argument("--sampai", type=int, default=10**7)
+    p = sub.add_parser("suite", help="jalur utama app di atas fake Google Sheets (tanpa jaringan)")
+    p.add_argument("--ukuran", type=int, nargs="+", default=[1000, 10000, 100000], help="jumlah baris transaksi & tunggakan")
+    p.add_argument("--ulang", type=int, default=3)
+    p.add_argument("--latensi", type=float, default=0.05, help="detik per panggilan API")
+    p.add_argument("--rasio-kuota", type=float, default=0.0, help="peluang panggilan ditolak kuota (429)")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--simpan", default=None, help="file JSON hasil (default benchmark_hasil/<waktu>.json)")
+    p.add_argument("--banding", default=None, help="file JSON hasil sebelumnya")
+    args = parser.parse_args()
+
+    if args.perintah == "terbilang":
+        if args.verify: verify_terbilang(args.sampai)
+        bench_terbilang(args.jumlah)
+    elif args.perintah == "suite":
+        hasil = run_suite(args.ukuran, args.ulang, args.latensi, args.rasio_kuota, args.seed)
+        simpan_hasil(hasil, args.simpan or f"benchmark_hasil/{datetime.now():%Y%m%d_%H%M%S}.json",
+                     {"latensi": args.latensi, "rasio_kuota": args.rasio_kuota, "ulang": args.ulang})
+        if args.banding: banding(hasil, args.banding)
+
+if __name__ == '__main__':
+    main()
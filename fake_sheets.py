@@ -0,0 +1,196 @@
+# Pengganti Google Sheets untuk uji & benchmark offline (tanpa jaringan, tanpa kredensial)
+#
+#   client = FakeClient(latensi=0.05, rasio_kuota=0.01)          -> di memori
+#   client = FakeClient(path="sheets.json")                       -> disimpan ke file setiap kali ada perubahan
+#   app.get_sheets_pool().set_authorizer(lambda: client)          -> SheetsBackend memakai client ini
+#
+# Hanya method gspread yang dipakai app.py yang ditiru. Nilai disimpan sebagai teks seperti tampilan Sheets,
+# lalu dikonversi ke angka saat get_all_records() seperti gspread.
+import json
+import os
+import random
+import threading
+import time
+
+import gspread
+from gspread.utils import a1_range_to_grid_range, numericise_all
+
+
+class _Response:
+    # Bentuk minimal requests.Response yang dibutuhkan gspread.exceptions.APIError
+    def __init__(self, code, message, status):
+        self.status_code = code
+        self.text = message
+        self._body = {"error": {"code": code, "message": message, "status": status}}
+
+    def json(self):
+        return self._body
+
+
+def _teks(v):
+    # Nilai sel seperti yang dikembalikan Sheets: angka bulat tanpa ".0", kosong untuk None/NaN
+    if hasattr(v, 'item'): v = v.item()
+    if v is None or (isinstance(v, float) and v != v): return ""
+    if isinstance(v, bool): return "TRUE" if v else "FALSE"
+    if isinstance(v, float) and v.is_integer(): return str(int(v))
+    return str(v)
+
+
+def _nilai_sel(cell):
+    entered = cell.get("userEnteredValue", {})
+    for k in ("stringValue", "numberValue", "boolValue", "formulaValue"):
+        if k in entered: return _teks(entered[k])
+    return ""
+
+
+class FakeClient:
+    def __init__(self, latensi=0.0, rasio_kuota=0.0, path=None, seed=None):
+        self.latensi = latensi
+        self.rasio_kuota = rasio_kuota
+        self.path = path
+        self._rng = random.Random(seed)
+        self._lock = threading.RLock()
+        self.stats = {"panggilan": 0, "error_kuota": 0}
+        self.spreadsheets = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for title, sheets in json.load(f).items():
+                    sh = self.create(title)
+                    for name, rows in sheets.items(): sh.add_worksheet(name, len(rows), max(map(len, rows), default=0))._rows = rows
+
+    def _call(self):
+        # Satu panggilan API: tunggu latensi, lalu kadang ditolak kuota (HTTP 429) seperti Sheets API
+        with self._lock: self.stats["panggilan"] += 1
+        if self.latensi: time.sleep(self.latensi)
+        if self.rasio_kuota and self._rng.random() < self.rasio_kuota:
+            with self._lock: self.stats["error_kuota"] += 1
+            raise gspread.exceptions.APIError(_Response(429, "Quota exceeded for quota metric 'Read requests'", "RESOURCE_EXHAUSTED"))
+
+    def _persist(self):
+        if not self.path: return
+        with self._lock:
+            data = {t: {ws.title: ws._rows for ws in sh._worksheets} for t, sh in self.spreadsheets.items()}
+            with open(self.path + ".tmp", "w") as f: json.dump(data, f)
+            os.replace(self.path + ".tmp", self.path)
+
+    def create(self, title):
+        sh = self.spreadsheets[title] = FakeSpreadsheet(self, title)
+        return sh
+
+    def open(self, title):
+        self._call()
+        if title not in self.spreadsheets: self.create(title)
+        return self.spreadsheets[title]
+
+
+class FakeSpreadsheet:
+    def __init__(self, client, title):
+        self.client = client
+        self.title = title
+        self._worksheets = []
+
+    def worksheet(self, title):
+        self.client._call()
+        for ws in self._worksheets:
+            if ws.title == title: return ws
+        raise gspread.exceptions.WorksheetNotFound(title)
+
+    def add_worksheet(self, title, rows, cols):
+        if any(ws.title == title for ws in self._worksheets): raise gspread.exceptions.APIError(_Response(400, f"Sheet {title} sudah ada", "INVALID_ARGUMENT"))
+        ws = FakeWorksheet(self, title, len(self._worksheets), rows, cols)
+        self._worksheets.append(ws)
+        return ws
+
+    def seed(self, title, header, rows):
+        # Isi worksheet langsung tanpa dihitung sebagai panggilan API (untuk menyiapkan data uji)
+        ws = next((w for w in self._worksheets if w.title == title), None) or self.add_worksheet(title, 1000, len(header))
+        ws._rows = [list(header)] + [[_teks(v) for v in r] for r in rows]
+        return ws
+
+    def batch_update(self, body):
+        # Mendukung request yang dibuat app._delta_requests: updateCells, deleteDimension (ROWS), appendCells
+        self.client._call()
+        by_id = {ws.id: ws for ws in self._worksheets}
+        with self.client._lock:
+            for req in body.get("requests", []):
+                if "updateCells" in req:
+                    r = req["updateCells"]
+                    ws, rng = by_id[r["range"]["sheetId"]], r["range"]
+                    for i, row in enumerate(r["rows"]):
+                        ws._set_row(rng["startRowIndex"] + i, rng.get("startColumnIndex", 0), [_nilai_sel(c) for c in row["values"]])
+                elif "deleteDimension" in req:
+                    rng = req["deleteDimension"]["range"]
+                    del by_id[rng["sheetId"]]._rows[rng["startIndex"]:rng["endIndex"]]
+                elif "appendCells" in req:
+                    r = req["appendCells"]
+                    by_id[r["sheetId"]]._rows.extend([_nilai_sel(c) for c in row["values"]] for row in r["rows"])
+                else: raise NotImplementedError(f"Request tidak didukung: {list(req)}")
+        self.client._persist()
+        return {"replies": [{} for _ in body.get("requests", [])]}
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title, sheet_id, rows, cols):
+        self.spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id
+        self._grid = (rows, cols)
+        self._rows = []
+
+    @property
+    def row_count(self): return max(self._grid[0], len(self._rows))
+
+    @property
+    def col_count(self): return max([self._grid[1]] + [len(r) for r in self._rows[:1]])
+
+    def _set_row(self, r, c, values):
+        while len(self._rows) <= r: self._rows.append([])
+        row = self._rows[r]
+        row.extend([""] * (c + len(values) - len(row)))
+        row[c:c + len(values)] = values
+
+    def _write(self, fn):
+        self.spreadsheet.client._call()
+        with self.spreadsheet.client._lock: result = fn()
+        self.spreadsheet.client._persist()
+        return result
+
+    def get_all_records(self):
+        self.spreadsheet.client._call()
+        with self.spreadsheet.client._lock: rows = [list(r) for r in self._rows]
+        if not rows: return []
+        header = rows[0]
+        return [dict(zip(header, numericise_all(r + [""] * (len(header) - len(r)), default_blank=""))) for r in rows[1:]]
+
+    def col_values(self, col, **kwargs):
+        self.spreadsheet.client._call()
+        with self.spreadsheet.client._lock: values = [r[col - 1] if len(r) >= col else "" for r in self._rows]
+        while values and values[-1] == "": values.pop()
+        return values
+
+    def append_row(self, values, **kwargs):
+        return self._write(lambda: self._rows.append([_teks(v) for v in values]))
+
+    def append_rows(self, values, **kwargs):
+        return self._write(lambda: self._rows.extend([_teks(v) for v in r] for r in values))
+
+    def update(self, range_name='A1', values=None, **kwargs):
+        start = a1_range_to_grid_range(range_name)
+        def _update():
+            for i, row in enumerate(values or []):
+                self._set_row(start.get("startRowIndex", 0) + i, start.get("startColumnIndex", 0), [_teks(v) for v in row])
+        return self._write(_update)
+
+    def batch_clear(self, ranges):
+        def _clear():
+            for name in ranges:
+                g = a1_range_to_grid_range(name)
+                for r in range(g.get("startRowIndex", 0), min(g.get("endRowIndex", len(self._rows)), len(self._rows))):
+                    row = self._rows[r]
+                    for c in range(g.get("startColumnIndex", 0), min(g.get("endColumnIndex", len(row)), len(row))): row[c] = ""
+            # Baris yang seluruhnya kosong di ujung bawah tidak ikut dikembalikan Sheets
+            while self._rows and not any(self._rows[-1]): self._rows.pop()
+        return self._write(_clear)
+
+    def delete_rows(self, start_index, end_index=None):
+        return self._write(lambda: self._rows.__delitem__(slice(start_index - 1, end_index or start_index)))